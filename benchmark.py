@@ -0,0 +1,566 @@
+# Header Comment
+# Project: [Match Titles to Files] [https://github.com/GreenBeanio/Match-Titles-to-Files]
+# Copyright: Copyright (c) [2024]-[2024] [Match Titles to Files] Contributors
+# Version: [0.1]
+# Status: [Development]
+# License(s): [MIT]
+# Author(s): [Garrett Johnson (GreenBeanio) - https://github.com/greenbeanio]
+# Maintainer: [Garrett Johnson (GreenBeanio) - https://github.com/greenbeanio]
+# Project Description: [This project is used to try to match titles to corresponding files.]
+# File Description: This file benchmarks the matching on generated titles and files.
+
+# Imports
+import pandas
+import pathlib
+import logging
+import argparse
+import tempfile
+import shutil
+import hashlib
+import platform
+import random
+import json
+import time
+import statistics
+import subprocess
+import sys
+import main
+from typing import Dict, List, Optional, Tuple
+
+# Syllables used to make up words (so there are enough different words for large corpora)
+SYLLABLES = "ka ri to na mi sho ren dai lo vel mar tin ser ba ko ra zen li qua dor fel gan hu ish jo ken lum nor pel sar tor ul vin wen yor zu che bri dra".split()
+# Common words that show up in a lot of titles
+COMMON_WORDS = "the a of and night day star war love dark city king lost road river house fire time black white last return story dream ghost moon sea".split()
+# Tags that get added to the file names
+FILE_TAGS = [
+    "1080p",
+    "720p",
+    "x264",
+    "HEVC",
+    "BluRay",
+    "WEB-DL",
+    "[Group]",
+    "(Remastered)",
+]
+# Extensions for the files
+FILE_EXTENSIONS = [".mkv", ".mp4", ".avi", ".srt"]
+
+
+# Class to hold a generated corpus and its ground truth
+class Corpus:
+    # Initialization
+    def __init__(
+        self,
+        input_csv: pathlib.Path,
+        file_directory: pathlib.Path,
+        expected: List[Optional[str]],
+    ) -> None:
+        self.input_csv = input_csv
+        self.file_directory = file_directory
+        # The file name each title should be matched to (None if the title doesn't have a file)
+        self.expected = expected
+
+
+# Function to make a random word
+def createWord(rng: random.Random) -> str:
+    if rng.random() < 0.3:
+        return rng.choice(COMMON_WORDS)
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+# Function to make a random title
+def createTitle(rng: random.Random) -> str:
+    title = " ".join(createWord(rng).capitalize() for _ in range(rng.randint(1, 5)))
+    if rng.random() < 0.3:
+        title += f" ({rng.randint(1950, 2024)})"
+    return title
+
+
+# Function to make a file name from a title with some noise (separators, case, typos, word order, and tags)
+def createStem(rng: random.Random, title: str) -> str:
+    stem = title
+    # Changing the separators
+    if rng.random() < 0.3:
+        stem = stem.replace(" ", rng.choice([".", "_", "-"]))
+    # Changing the case
+    if rng.random() < 0.2:
+        stem = rng.choice([stem.lower(), stem.upper()])
+    # Deleting or swapping a letter
+    if rng.random() < 0.15 and len(stem) > 4:
+        spot = rng.randrange(len(stem) - 1)
+        if rng.random() < 0.5:
+            stem = stem[:spot] + stem[spot + 1 :]
+        else:
+            stem = stem[:spot] + stem[spot + 1] + stem[spot] + stem[spot + 2 :]
+    # Changing the order of the words
+    if rng.random() < 0.1:
+        words = stem.split()
+        rng.shuffle(words)
+        stem = " ".join(words)
+    # Adding tags
+    if rng.random() < 0.2:
+        stem += " " + " ".join(rng.sample(FILE_TAGS, rng.randint(1, 2)))
+    return stem
+
+
+# Function to generate titles and files (with duplicates, near duplicates, directories, and files without titles)
+def generateCorpus(
+    directory: pathlib.Path, title_count: int, file_count: int, seed: int
+) -> Corpus:
+    rng = random.Random(seed)
+    file_directory = directory / "files"
+    # Removing the files of an earlier corpus (so a kept corpus path can be used again without mixing them in)
+    if file_directory.exists():
+        shutil.rmtree(file_directory)
+    file_directory.mkdir(parents=True)
+    # Creating the titles
+    titles = []
+    seen = set()
+    while len(titles) < title_count:
+        roll = rng.random()
+        if roll < 0.02 and len(titles) > 0:
+            # Exact duplicate of an earlier title
+            title = rng.choice(titles)
+        elif roll < 0.07 and len(titles) > 0:
+            # Near duplicate of an earlier title (like a sequel)
+            title = f"{rng.choice(titles)} {rng.choice(['2', '3', 'II', 'Part 2', 'Returns'])}"
+        else:
+            title = createTitle(rng)
+        if title in seen and roll >= 0.02:
+            continue
+        seen.add(title)
+        titles.append(title)
+    # Creating the files for most of the titles (as long as there's room in the file count)
+    expected = [None] * title_count
+    paths = [""] * title_count
+    names = set()
+    first = {}
+    created = 0
+    for index, title in enumerate(titles):
+        # Duplicate titles should be matched to the file of the first one
+        if title in first:
+            expected[index] = expected[first[title]]
+            continue
+        first[title] = index
+        if created >= file_count or rng.random() < 0.1:
+            continue
+        stem = createStem(rng, title)
+        # The file names have to be unique (ignoring case)
+        while stem.lower() in names:
+            stem += f" {rng.randint(0, 9)}"
+        names.add(stem.lower())
+        # Directories are matched by their stem, so only names without dots are used for them
+        if rng.random() < 0.15 and "." not in stem:
+            name = stem
+            (file_directory / name).mkdir()
+        else:
+            name = stem + rng.choice(FILE_EXTENSIONS)
+            (file_directory / name).touch()
+        created += 1
+        # Some of the titles already have their path filled in
+        if rng.random() < 0.03:
+            paths[index] = name
+        else:
+            expected[index] = name
+    # Creating files that don't belong to any title
+    while created < file_count:
+        stem = " ".join(createWord(rng) for _ in range(rng.randint(2, 5)))
+        if stem.lower() in names:
+            continue
+        names.add(stem.lower())
+        (file_directory / (stem + rng.choice(FILE_EXTENSIONS))).touch()
+        created += 1
+    # Writing the titles
+    input_csv = directory / "titles.csv"
+    pandas.DataFrame({"Title": titles, "Path": paths}).to_csv(input_csv, index=False)
+    return Corpus(input_csv, file_directory, expected)
+
+
+# Function to time a function call
+def timeCall(timings: Dict[str, float], key: str, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    timings[key] = timings.get(key, 0.0) + time.perf_counter() - start
+    return result
+
+
+# Function to run the matching the same way main.runStages does, but timing every step
+def timeStages(
+    corpus: Corpus,
+    score_limit: int,
+    score_engine: int,
+    assignment: str = "greedy",
+    retriever: Optional[main.NgramRetriever] = None,
+) -> Tuple[Dict[str, float], pandas.DataFrame]:
+    timings = {}
+    input_df = timeCall(
+        timings,
+        "readCsv",
+        lambda: main.prepareInputDataframe(main.readCsv(corpus.input_csv)),
+    )
+    file_df = timeCall(timings, "getFiles", main.getFiles, corpus.file_directory)
+    search_df, file_titles = timeCall(
+        timings,
+        "createDesiredDataframes",
+        main.createDesiredDataframes,
+        input_df,
+        file_df,
+    )
+    file_table, title_table = timeCall(
+        timings, "createTables", main.createTables, file_titles, search_df
+    )
+    for stage in main.getStages(score_engine):
+        if len(file_table.remaining()) == 0 or len(title_table.remaining()) == 0:
+            break
+        if assignment == "optimal":
+            timeCall(
+                timings,
+                f"assignOptimal_{stage}",
+                main.assignOptimal,
+                file_table,
+                title_table,
+                stage,
+                score_limit,
+                retriever=retriever,
+            )
+        else:
+            timeCall(
+                timings,
+                f"findSimilarity_{stage}",
+                main.findSimilarity,
+                file_table,
+                title_table,
+                stage,
+                score_limit,
+                retriever=retriever,
+            )
+            timeCall(
+                timings,
+                f"checkAllMatching_{stage}",
+                main.checkAllMatching,
+                file_table,
+                title_table,
+                score_limit,
+                stage,
+            )
+        timeCall(
+            timings,
+            f"updateInputDataframe_{stage}",
+            main.updateInputDataframe,
+            title_table,
+            file_table,
+            input_df,
+        )
+        main.clearResults(file_table, title_table)
+    timings["total"] = sum(timings.values())
+    return (timings, input_df)
+
+
+# Function to score the matches against the ground truth
+def checkQuality(corpus: Corpus, output_df: pandas.DataFrame) -> Dict[str, float]:
+    matched = output_df["Score"].notna().to_numpy()
+    paths = list(output_df["Path"])
+    correct = [matched[x] and paths[x] == corpus.expected[x] for x in range(len(paths))]
+    expected_files = {x for x in corpus.expected if x is not None}
+    found_files = {paths[x] for x in range(len(paths)) if correct[x]}
+    return {
+        "matched": int(matched.sum()),
+        "correct": int(sum(correct)),
+        "expected": len(expected_files),
+        "precision": sum(correct) / max(1, int(matched.sum())),
+        "recall": len(found_files) / max(1, len(expected_files)),
+    }
+
+
+# Function to get how many of the exact matches were also made when only the candidates were scored
+def matchRecall(exact_df: pandas.DataFrame, output_df: pandas.DataFrame) -> float:
+    exact = exact_df["Score"].notna().to_numpy()
+    same = exact & (exact_df["Path"] == output_df["Path"]).to_numpy()
+    return int(same.sum()) / max(1, int(exact.sum()))
+
+
+# Function to get how many of the pairs the first engine finds above the score limit are candidates
+def pairRecall(
+    corpus: Corpus, score_limit: int, score_engine: int, candidates: int
+) -> float:
+    input_df = main.prepareInputDataframe(main.readCsv(corpus.input_csv))
+    file_df = main.getFiles(corpus.file_directory)
+    search_df, file_titles = main.createDesiredDataframes(input_df, file_df)
+    file_table, title_table = main.createTables(file_titles, search_df)
+    stage = main.getStages(score_engine)[0]
+    found = []
+    for retriever in [None, main.NgramRetriever(candidates)]:
+        _, _, rows, columns, _ = main.findStagePairs(
+            file_table, title_table, stage, score_limit, retriever=retriever
+        )
+        found.append(set(zip(rows.tolist(), columns.tolist())))
+    return len(found[0] & found[1]) / max(1, len(found[0]))
+
+
+# Function to get a digest of the results (so a change in the results is caught even if the quality is the same)
+def resultDigest(output_df: pandas.DataFrame) -> str:
+    return hashlib.sha256(
+        output_df.drop("Index", axis=1).to_csv(index=False).encode("utf-8")
+    ).hexdigest()
+
+
+# Function to benchmark one size of corpus
+def runBenchmark(
+    directory: pathlib.Path,
+    title_count: int,
+    file_count: int,
+    seed: int,
+    score_limit: int,
+    score_engine: int,
+    assignment: str = "greedy",
+    candidates: List[int] = (),
+) -> dict:
+    start = time.perf_counter()
+    corpus = generateCorpus(directory, title_count, file_count, seed)
+    generate_time = time.perf_counter() - start
+    timings, output_df = timeStages(corpus, score_limit, score_engine, assignment)
+    result = {
+        "titles": title_count,
+        "files": file_count,
+        "generate": generate_time,
+        "timings": timings,
+        "quality": checkQuality(corpus, output_df),
+        "digest": resultDigest(output_df),
+        "retrieval": [],
+    }
+    logger.info(
+        f"{title_count}x{file_count}: {timings['total']:.3f}s, precision {result['quality']['precision']:.4f}, recall {result['quality']['recall']:.4f}"
+    )
+    # Only scoring the n-gram candidates (the recall is against the exact results)
+    for count in candidates:
+        retrieval_timings, retrieval_df = timeStages(
+            corpus,
+            score_limit,
+            score_engine,
+            assignment,
+            main.NgramRetriever(count),
+        )
+        retrieval = {
+            "candidates": count,
+            "timings": retrieval_timings,
+            "quality": checkQuality(corpus, retrieval_df),
+            "match_recall": matchRecall(output_df, retrieval_df),
+            "pair_recall": pairRecall(corpus, score_limit, score_engine, count),
+        }
+        result["retrieval"].append(retrieval)
+        logger.info(
+            f"{title_count}x{file_count} with {count} candidates: {retrieval_timings['total']:.3f}s, {retrieval['match_recall']:.4f} of the matches and {retrieval['pair_recall']:.4f} of the pairs found"
+        )
+    return result
+
+
+# Function to time starting the cli from nothing (the help, invalid arguments, and a tiny job), like it's called by other programs
+def timeColdStart(directory: pathlib.Path, repeats: int, seed: int) -> dict:
+    corpus = generateCorpus(directory / "10x10", 10, 10, seed)
+    script = pathlib.Path(main.__file__).resolve()
+    commands = {
+        "help": [sys.executable, str(script), "-h"],
+        "invalid_args": [
+            sys.executable,
+            str(script),
+            "-i",
+            str(directory / "missing.csv"),
+            "-f",
+            str(corpus.file_directory),
+        ],
+        "job_10x10": [
+            sys.executable,
+            str(script),
+            "-i",
+            str(corpus.input_csv),
+            "-f",
+            str(corpus.file_directory),
+            "-o",
+            str(directory / "matched.csv"),
+        ],
+    }
+    cold_start = {}
+    for key, command in commands.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            times.append(time.perf_counter() - start)
+        cold_start[key] = {"median": statistics.median(times), "min": min(times)}
+        logger.info(
+            f"Cold start {key}: {cold_start[key]['median']:.3f}s median, {cold_start[key]['min']:.3f}s min"
+        )
+    return cold_start
+
+
+# Function to compare the results to an earlier run
+def compareResults(results: dict, previous: dict) -> bool:
+    same = True
+    # The cold starts are only compared by time (there aren't any results to check)
+    for key, value in results.get("cold_start", {}).items():
+        old = previous.get("cold_start", {}).get(key)
+        if old is not None:
+            logger.info(
+                f"Cold start {key}: {old['median']:.4f}s -> {value['median']:.4f}s ({old['median'] / max(value['median'], 1e-9):.2f}x)"
+            )
+    earlier = {(x["titles"], x["files"]): x for x in previous["runs"]}
+    for run in results["runs"]:
+        old = earlier.get((run["titles"], run["files"]))
+        if old is None:
+            continue
+        size = f"{run['titles']}x{run['files']}"
+        for key, value in run["timings"].items():
+            if key in old["timings"] and old["timings"][key] > 0:
+                logger.info(
+                    f"{size} {key}: {old['timings'][key]:.4f}s -> {value:.4f}s ({old['timings'][key] / max(value, 1e-9):.2f}x)"
+                )
+        # The results should only change when the settings or the matching are meant to change
+        if run["digest"] != old["digest"] or run["quality"] != old["quality"]:
+            same = False
+            logger.warning(
+                f"{size} results changed: {old['quality']} -> {run['quality']}"
+            )
+    return same
+
+
+# Function to parse a size (titles x files)
+def parseSize(value: str) -> Tuple[int, int]:
+    try:
+        title_count, file_count = (int(x) for x in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'The size must be TITLESxFILES, not "{value}"'
+        )
+    return (title_count, file_count)
+
+
+# Function to set up CLI arguments
+def createCliArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the matching on generated titles and files"
+    )
+    parser.add_argument(
+        "--sizes",
+        help="Sizes of the corpora as TITLESxFILES. Default: 1000x1000 10000x10000 100000x100000",
+        type=parseSize,
+        nargs="+",
+        default=[(1000, 1000), (10000, 10000), (100000, 100000)],
+    )
+    parser.add_argument(
+        "-s",
+        "--score_limit",
+        help="The score limit. Default: 90",
+        type=int,
+        default=90,
+        choices=range(0, 101),
+        metavar="[0-100]",
+    )
+    parser.add_argument(
+        "-e",
+        "--score_engine",
+        help="The engine to use. Default: -1",
+        type=int,
+        default=-1,
+        choices=range(-1, 6),
+        metavar="[-1-5]",
+    )
+    parser.add_argument(
+        "-a",
+        "--assignment",
+        help="How to pick the matches: greedy or optimal. Default: greedy",
+        choices=main.ASSIGNMENTS,
+        default="greedy",
+    )
+    parser.add_argument(
+        "--candidates",
+        help="Also run with only this many n-gram candidates scored for each title and measure the recall against the exact results (can be more than one)",
+        type=int,
+        nargs="+",
+        default=[],
+    )
+    parser.add_argument(
+        "--cold_start",
+        help="Also time this many runs of the cli from a new process for -h, invalid arguments, and a 10x10 job. Default: 0 (not timed)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--seed", help="The seed for the corpora. Default: 1", type=int, default=1
+    )
+    parser.add_argument(
+        "-o",
+        "--output_path",
+        help="Path to write the results json. Default: benchmark.json in the current directory",
+        type=pathlib.Path,
+        default=pathlib.Path("benchmark.json"),
+    )
+    parser.add_argument(
+        "--compare",
+        help="Path to the results json of an earlier run to compare to",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--corpus_path",
+        help="Directory to keep the generated corpora in (the corpora in it are made again every run). Default: a temporary directory that's removed",
+        type=pathlib.Path,
+    )
+    return parser.parse_args()
+
+
+# Function to run the benchmarks
+def benchmark() -> None:
+    main.createLogger("Title Matcher Benchmark")
+    # Only showing the warnings from the matching
+    main.createLogger("Title Matcher").setLevel(logging.WARNING)
+    cli_args = createCliArgs()
+    results = {
+        "settings": {
+            "score_limit": cli_args.score_limit,
+            "score_engine": cli_args.score_engine,
+            "assignment": cli_args.assignment,
+            "seed": cli_args.seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as temp_directory:
+        base = cli_args.corpus_path or pathlib.Path(temp_directory)
+        if cli_args.cold_start > 0:
+            results["cold_start"] = timeColdStart(
+                base / "cold_start", cli_args.cold_start, cli_args.seed
+            )
+        for title_count, file_count in cli_args.sizes:
+            results["runs"].append(
+                runBenchmark(
+                    base / f"{title_count}x{file_count}",
+                    title_count,
+                    file_count,
+                    cli_args.seed,
+                    cli_args.score_limit,
+                    cli_args.score_engine,
+                    cli_args.assignment,
+                    cli_args.candidates,
+                )
+            )
+    with open(cli_args.output_path, "w", encoding="utf-8") as out_file:
+        json.dump(results, out_file, indent=2)
+    logger.info(f'Wrote the results at "{cli_args.output_path}"')
+    # Exiting with an error if the results changed from the earlier run
+    if cli_args.compare is not None:
+        with open(cli_args.compare, encoding="utf-8") as previous_file:
+            if not compareResults(results, json.load(previous_file)):
+                sys.exit(1)
+
+
+# The logger used by every function
+logger = logging.getLogger("Title Matcher Benchmark")
+
+if __name__ == "__main__":
+    benchmark()
+
+# Footer Comment
+# History of Contributions:
+# [2024-2024] - [Garrett Johnson (GreenBeanio) - https://github.com/greenbeanio] - [The entire document]
@@ -10,17 +10,69 @@
 # File Description: This is the main file for the project.
 
 # Imports
-import pandas
-import thefuzz
+from __future__ import annotations
+import importlib
 import pathlib
 import logging
+import collections
+import concurrent.futures
+from multiprocessing import shared_memory
+import fnmatch
+import math
+import os
+import json
+import hashlib
+import sqlite3
+import tempfile
 import sys
+import heapq
+import time
+import cProfile
+import ctypes
+import ctypes.util
+import errno
+import select
+import signal
+import struct
+import contextlib
+import re
+import unicodedata
+import functools
+import itertools
 import argparse
-import numpy
-import thefuzz.fuzz
-import thefuzz.process
-from typing import List, Tuple, Union
-import hashlib
+import http.server
+import urllib.parse
+import csv
+import thefuzz.utils
+import rapidfuzz.fuzz
+import rapidfuzz.process
+
+# The peak memory is only recorded where the resource module is available (not on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+# Class to import a module the first time one of its attributes is used (so -h, invalid arguments, and small jobs don't wait for it)
+# Nothing is added to sys.modules until then (rapidfuzz looks for pandas there on every call)
+class LazyModule:
+    # Initialization
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+
+    # Function to get an attribute of the module (imported the first time)
+    def __getattr__(self, attribute: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+# Pandas and numpy are the slowest imports by far, they're only loaded once the data frames or the scores are needed
+pandas = LazyModule("pandas")
+numpy = LazyModule("numpy")
 
 
 # Class to hold the path settings
@@ -32,114 +84,1339 @@ class UserPaths:
         output_csv: pathlib.Path,
         score_limit: int,
         score_engine: int,
+        cache_path: Optional[pathlib.Path],
+        cache_size: int,
+        manifest_path: Optional[pathlib.Path],
+        depth: int,
+        include: List[str],
+        exclude: List[str],
+        scan_threads: int,
+        single_pass: bool,
+        fold_unicode: bool,
+        collapse_separators: bool,
+        strip_tags: List[str],
+        workers: int,
+        shard: Optional[Tuple[int, int]],
+        merge_paths: List[pathlib.Path],
+        metrics_path: Optional[pathlib.Path],
+        profile: bool,
+        assignment: str,
+        watch: bool,
+        poll_interval: float,
+        serve: Optional[Tuple[str, int]],
+        query_cache_size: int,
+        candidates: int,
+        ngram_size: int,
+        score_map: Optional[pathlib.Path] = None,
+        tile_size: int = 2048,
+        score_limits: Optional[List[int]] = None,
+        checkpoint_path: Optional[pathlib.Path] = None,
+        checkpoint_interval: float = 600.0,
+        resume: bool = False,
+        file_listing: Optional[List[os.DirEntry]] = None,
     ) -> None:
         self.input_csv = input_csv
         self.file_directory = file_directory
         self.output_csv = output_csv
         self.score_limit = score_limit
         self.score_engine = score_engine
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.manifest_path = manifest_path
+        self.depth = depth
+        self.include = include
+        self.exclude = exclude
+        self.scan_threads = scan_threads
+        self.single_pass = single_pass
+        self.fold_unicode = fold_unicode
+        self.collapse_separators = collapse_separators
+        self.strip_tags = strip_tags
+        self.workers = workers
+        self.shard = shard
+        self.merge_paths = merge_paths
+        self.metrics_path = metrics_path
+        self.profile = profile
+        self.assignment = assignment
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.serve = serve
+        self.query_cache_size = query_cache_size
+        self.candidates = candidates
+        self.ngram_size = ngram_size
+        self.score_map = score_map
+        self.tile_size = tile_size
+        # Every score limit to match with (the score limit is the lowest one)
+        self.score_limits = score_limits or [score_limit]
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        # The listing of the file directory from checking the arguments (so it isn't listed again)
+        self.file_listing = file_listing
+
+
+# Tags that are commonly added to the names of media files (stripped with --strip_media_tags)
+MEDIA_TAGS = [
+    r"\[[^\]]*\]",  # Anything in square brackets (release groups, checksums, etc.)
+    r"\((?:19|20)\d{2}\)",  # Years in parentheses
+    # The tags have to be surrounded by something that isn't a letter or number (underscores count as separators)
+    r"(?<![a-z0-9])(?:\d{3,4}p|4k|uhd|hdr|10bit|8bit)(?![a-z0-9])",  # Resolutions and color depths
+    r"(?<![a-z0-9])(?:x26[45]|h\.?26[45]|hevc|avc|xvid|divx|aac|ac3|dts|flac|mp3)(?![a-z0-9])",  # Codecs
+    r"(?<![a-z0-9])(?:bluray|blu-ray|bdrip|brrip|dvdrip|webrip|web-dl|hdtv|remux)(?![a-z0-9])",  # Sources
+]
+
+# Everything that isn't a letter or a number (collapsed into single spaces with --collapse_separators)
+SEPARATORS = re.compile(r"[\W_]+")
+
+
+# Class to hold the normalization of the titles and file titles (applied once to every string before it's scored)
+# With the default settings the strings are only made lower case (the same as without a normalizer)
+class Normalizer:
+    # Number of normalized strings to remember (so repeated strings are only normalized once)
+    cache_size = 2**16
+
+    # Initialization
+    def __init__(
+        self,
+        fold_unicode: bool = False,
+        collapse_separators: bool = False,
+        strip_tags: Iterable[str] = (),
+    ) -> None:
+        self.fold_unicode = fold_unicode
+        self.collapse_separators = collapse_separators
+        self.strip_tags = [re.compile(x, re.IGNORECASE) for x in strip_tags]
+        self.normalize = functools.lru_cache(maxsize=self.cache_size)(
+            self.normalizeString
+        )
+
+    # Function to normalize a string
+    def normalizeString(self, string: str) -> str:
+        # Making it lower case (I believe making it lower case will make them closer)
+        string = string.lower()
+        # Taking the accents off of letters and folding compatibility characters (full width letters, ligatures, etc.)
+        if self.fold_unicode:
+            string = "".join(
+                x
+                for x in unicodedata.normalize("NFKD", string)
+                if not unicodedata.combining(x)
+            )
+        # Removing the tags
+        for tag in self.strip_tags:
+            string = tag.sub(" ", string)
+        # Turning runs of punctuation, underscores, and whitespace into single spaces
+        if self.collapse_separators:
+            string = SEPARATORS.sub(" ", string).strip()
+        return string
+
+    # Function to get the settings (to check that two runs normalized the strings the same way)
+    def settings(self) -> list:
+        return [
+            self.fold_unicode,
+            self.collapse_separators,
+            [x.pattern for x in self.strip_tags],
+        ]
+
 
+# Class to hold the files and their fuzz results (each file is found by its integer id, which is its position)
+class FileTable:
+    # Number of titles to keep as results for each file
+    result_limit = 5
 
-# Class to hold the results of file fuzz
-class FileFuzzResult:
+    # Initialization
     def __init__(
-        self, path: pathlib.Path, name: str, title: str, ftype: bool, ind: int
+        self,
+        df: pandas.DataFrame,
+        fresh: Optional[pandas.Series] = None,
+        normalizer: Optional[Normalizer] = None,
     ) -> None:
-        self.path = path
-        self.name = name
-        self.title = title
-        self.ftype = ftype
-        self.ind = ind
-        self.results = []
+        # The directory of each file is kept as a code into the directory table (the paths are only made when they're needed)
+        self.directory = df["Directory"].cat.codes.to_numpy()
+        self.directories = list(df["Directory"].cat.categories)
+        self.base = list(df["Base"])
+        self.name = list(df["Name"])
+        self.title = list(df["Title"])
+        # The normalized titles and their processed forms for the engines (only processed the first time they're needed)
+        self.normalized = normalizeStrings(self.title, normalizer)
+        self.forms = {}
+        self.ftype = df["Type"].to_numpy(dtype=bool)
+        self.ind = df.index.to_numpy()
+        # Files that have already been matched (so that they wont be used in further results)
+        self.used = numpy.zeros(len(df), dtype=bool)
+        # Files that are new or changed since the last run (every file is new without a manifest)
+        self.fresh = createFreshMask(df, fresh)
+        # The best title ids for each file (-1 is an empty result) and their scores
+        self.result_title = numpy.full(
+            (len(df), self.result_limit), -1, dtype=numpy.intp
+        )
+        self.result_score = numpy.zeros((len(df), self.result_limit), dtype=numpy.int64)
 
     # Print information
     def __str__(self) -> str:
-        return (
-            f"Title: {self.title}\n"
-            f"Results: {self.results}\n"
-            f"Path: {self.path}\n"
-            f"Name: {self.name}\n"
-            f"Type: {self.ftype}\n"
-            f"Index: {self.ind}"
+        return f"Files: {len(self.title)}\nRemaining: {len(self.remaining())}"
+
+    # Function to get the ids of the files that haven't been used
+    def remaining(self) -> numpy.ndarray:
+        return numpy.flatnonzero(~self.used)
+
+    # Function to get the path of a file
+    def filePath(self, file_id: int) -> pathlib.Path:
+        return pathlib.Path(
+            self.directories[self.directory[file_id]], self.base[file_id]
         )
 
-    # Function to update the class values
+    # Function to get the processed titles for an engine (files are processed like the choices)
+    def processed(self, token_engine: int) -> List[str]:
+        form = ENGINE_FORMS[token_engine]
+        if form not in self.forms:
+            self.forms[form] = processStrings(self.normalized, form, False)
+        return self.forms[form]
+
+    # Function to update the results from the scored pairs (ordered by score, ties by the lowest title id)
     def updateResults(
-        self,
-        result: List[Union[str, int]],
+        self, file_ids: numpy.ndarray, title_ids: numpy.ndarray, scores: numpy.ndarray
     ) -> None:
-        # Check if it's less than 5 (desired length)
-        if len(self.results) < 5:
-            # Add result
-            self.results.append(result)
-            # Only sort for the first 5 results
-            self.results.sort(key=lambda x: x[1], reverse=True)
-        else:
-            # Check if the score is larger than any of the existing results
-            for ind, i_result in enumerate(self.results):
-                if result[1] > i_result[1]:
-                    # Insert the value
-                    self.results.insert(ind, result)
-                    # Remove the last value (since it'll be the smaller one)
-                    self.results.pop()  # could also do self.results = self.results[0:5]
-                    # Exit the loop
-                    break  # could return too
+        self.result_title, self.result_score = sparseTopIndices(
+            file_ids, title_ids, scores, len(self.title), self.result_limit
+        )
+
+    # Function to set the results of some of the files (already ordered)
+    def setResults(
+        self, file_ids: numpy.ndarray, title_ids: numpy.ndarray, scores: numpy.ndarray
+    ) -> None:
+        self.result_title[file_ids] = title_ids
+        self.result_score[file_ids] = scores
 
     # Function to clear the results
     def clearResults(self) -> None:
-        self.results = []
+        self.result_title.fill(-1)
+        self.result_score.fill(0)
 
 
-# Class to hold the results of title fuzz
-class TitleFuzzResult:
+# Class to hold the titles and their fuzz results (each title is found by its integer id, which is its position)
+class TitleTable:
+    # Number of files to keep as results for each title (first, second, and third)
+    result_limit = 3
+
     # Initialization
-    def __init__(self, title: str, ind: int) -> None:
-        self.title = title
-        self.ind = ind
-        self.first_result = []
-        self.second_result = []
-        self.third_result = []
-        self.match_result = []
+    def __init__(
+        self,
+        df: pandas.DataFrame,
+        fresh: Optional[pandas.Series] = None,
+        normalizer: Optional[Normalizer] = None,
+    ) -> None:
+        self.title = list(df["Title"])
+        # The normalized titles and their processed forms for the engines (only processed the first time they're needed)
+        self.normalized = normalizeStrings(self.title, normalizer)
+        self.forms = {}
+        self.ind = df.index.to_numpy()
+        # Titles that have already been matched and added to the input data frame
+        self.used = numpy.zeros(len(df), dtype=bool)
+        # Titles that are new since the last run (every title is new without a manifest)
+        self.fresh = createFreshMask(df, fresh)
+        # The best file ids for each title (-1 is an empty result) and their scores
+        self.result_file = numpy.full(
+            (len(df), self.result_limit), -1, dtype=numpy.intp
+        )
+        self.result_score = numpy.zeros((len(df), self.result_limit), dtype=numpy.int64)
+        # The matched file id (-1 if there's no match), score, iteration (0, 1, 2), and engine
+        self.match_file = numpy.full(len(df), -1, dtype=numpy.intp)
+        self.match_score = numpy.zeros(len(df), dtype=numpy.int64)
+        self.match_iteration = numpy.zeros(len(df), dtype=numpy.int64)
+        self.match_engine = numpy.zeros(len(df), dtype=numpy.int64)
 
     # Print information
     def __str__(self) -> str:
         return (
-            f"Title: {self.title}\n"
-            f"First: {self.first_result}\n"
-            f"Second: {self.second_result}\n"
-            f"Third: {self.third_result}\n"
-            f"Index: {self.ind}\n"
-            f"Match: {self.match_result}"
+            f"Titles: {len(self.title)}\n"
+            f"Remaining: {len(self.remaining())}\n"
+            f"Matched: {int((self.match_file >= 0).sum())}"
         )
 
-    # Function to update the class values
+    # Function to get the ids of the titles that haven't been used
+    def remaining(self) -> numpy.ndarray:
+        return numpy.flatnonzero(~self.used)
+
+    # Function to get the processed titles for an engine (titles are processed like the queries)
+    def processed(self, token_engine: int) -> List[str]:
+        form = ENGINE_FORMS[token_engine]
+        if form not in self.forms:
+            self.forms[form] = processStrings(self.normalized, form, True)
+        return self.forms[form]
+
+    # Function to update the results of the scored titles
     def updateResults(
-        self,
-        result1: List[Union[str, int]],
-        result2: List[Union[str, int]],
-        result3: List[Union[str, int]],
+        self, title_ids: numpy.ndarray, file_ids: numpy.ndarray, scores: numpy.ndarray
     ) -> None:
-        self.first_result = result1
-        self.second_result = result2
-        self.third_result = result3
+        count = file_ids.shape[1]
+        self.result_file[title_ids, :count] = file_ids
+        self.result_score[title_ids, :count] = scores
 
     # Function to assign the match value
-    def updateMatch(self, result: List) -> None:
-        self.match_result = result
+    def updateMatch(
+        self, title_id: int, file_id: int, score: int, search: int, token_engine: int
+    ) -> None:
+        self.match_file[title_id] = file_id
+        self.match_score[title_id] = score
+        self.match_iteration[title_id] = search
+        self.match_engine[title_id] = token_engine
 
     # Function to check if there is already a match
-    def checkMatch(self) -> bool:
-        if len(self.match_result) == 0:
-            return False
-        else:
-            return True
+    def checkMatch(self, title_id: int) -> bool:
+        return self.match_file[title_id] >= 0
 
     # Function to clear the results
     def clearResults(self) -> None:
-        self.first_result = []
-        self.second_result = []
-        self.third_result = []
-        self.match_result = []
+        self.result_file.fill(-1)
+        self.result_score.fill(0)
+
+
+# Class to store the scores of title and file pairs between runs (in a sqlite database)
+# Only the scores that are at least the score limit are stored (lower scores can never be a match)
+# For each engine every pair of the stored titles and stored files has been scored, so a missing score is a low score
+class ScoreCache:
+    # Initialization
+    def __init__(self, cache_path: pathlib.Path, cache_size: int) -> None:
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS engines (engine INTEGER PRIMARY KEY, score_limit INTEGER);
+            CREATE TABLE IF NOT EXISTS titles (engine INTEGER, title TEXT, PRIMARY KEY (engine, title));
+            CREATE TABLE IF NOT EXISTS files (engine INTEGER, file TEXT, PRIMARY KEY (engine, file));
+            CREATE TABLE IF NOT EXISTS scores (engine INTEGER, title TEXT, file TEXT, score REAL);
+            CREATE UNIQUE INDEX IF NOT EXISTS scores_pair ON scores (engine, title, file);
+            """)
+
+    # Print information
+    def __str__(self) -> str:
+        count = self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        return f"Path: {self.cache_path}\nScores: {count}\nSize: {self.cache_size}"
+
+    # Function to get the stored scores for the titles and files (the strings should already be processed)
+    def lookup(
+        self, token_engine: int, score_limit: int, titles: List[str], files: List[str]
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, List[Tuple[int, int, float]]]:
+        known_titles = numpy.zeros(len(titles), dtype=bool)
+        known_files = numpy.zeros(len(files), dtype=bool)
+        # The stored scores can't be used if they were stored with a higher score limit
+        row = self.connection.execute(
+            "SELECT score_limit FROM engines WHERE engine = ?", (token_engine,)
+        ).fetchone()
+        if row is None or row[0] > score_limit:
+            return (known_titles, known_files, [])
+        # Find which titles and files were already scored
+        title_lookup = {x: ind for ind, x in enumerate(titles)}
+        file_lookup = {x: ind for ind, x in enumerate(files)}
+        for (title,) in self.connection.execute(
+            "SELECT title FROM titles WHERE engine = ?", (token_engine,)
+        ):
+            if title in title_lookup:
+                known_titles[title_lookup[title]] = True
+        for (file,) in self.connection.execute(
+            "SELECT file FROM files WHERE engine = ?", (token_engine,)
+        ):
+            if file in file_lookup:
+                known_files[file_lookup[file]] = True
+        # Get the scores for the pairs of titles and files that are in this run (the scores are stored before rounding)
+        known = []
+        for title, file, score in self.connection.execute(
+            "SELECT title, file, score FROM scores WHERE engine = ? AND score >= ?",
+            (token_engine, score_limit - 0.5),
+        ):
+            if (
+                title in title_lookup
+                and file in file_lookup
+                and round(score) >= score_limit
+            ):
+                known.append((title_lookup[title], file_lookup[file], score))
+        return (known_titles, known_files, known)
+
+    # Function to store the new scores (every pair of the titles and files must have been scored)
+    def store(
+        self,
+        token_engine: int,
+        score_limit: int,
+        titles: List[str],
+        files: List[str],
+        scores: List[Tuple[str, str, float]],
+    ) -> None:
+        with self.connection:
+            # The stored titles and files are now only the ones from this run
+            self.connection.execute(
+                "DELETE FROM titles WHERE engine = ?", (token_engine,)
+            )
+            self.connection.execute(
+                "DELETE FROM files WHERE engine = ?", (token_engine,)
+            )
+            self.connection.executemany(
+                "INSERT INTO titles VALUES (?, ?)", ((token_engine, x) for x in titles)
+            )
+            self.connection.executemany(
+                "INSERT INTO files VALUES (?, ?)", ((token_engine, x) for x in files)
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO engines VALUES (?, ?)",
+                (token_engine, score_limit),
+            )
+            # Remove the scores that were stored with a lower score limit or for titles and files that are gone
+            self.connection.execute(
+                """
+                DELETE FROM scores WHERE engine = ?1 AND (
+                    score < ?2
+                    OR title NOT IN (SELECT title FROM titles WHERE engine = ?1)
+                    OR file NOT IN (SELECT file FROM files WHERE engine = ?1)
+                )
+                """,
+                (token_engine, score_limit - 0.5),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                ((token_engine, title, file, score) for title, file, score in scores),
+            )
+            self.evict()
+
+    # Function to remove the oldest titles (and their scores) when there are too many scores stored
+    def evict(self) -> None:
+        count = self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        if count <= self.cache_size:
+            return
+        excess = count - self.cache_size
+        removing = []
+        for engine, title, title_count in self.connection.execute(
+            "SELECT engine, title, COUNT(*) FROM scores GROUP BY engine, title ORDER BY MIN(rowid)"
+        ):
+            removing.append((engine, title))
+            excess -= title_count
+            if excess <= 0:
+                break
+        # Removing the title as well (so it will be scored again instead of missing scores)
+        self.connection.executemany(
+            "DELETE FROM scores WHERE engine = ? AND title = ?", removing
+        )
+        self.connection.executemany(
+            "DELETE FROM titles WHERE engine = ? AND title = ?", removing
+        )
+
+    # Function to close the database
+    def close(self) -> None:
+        self.connection.close()
+
+
+# Class to score the titles in shards on a pool of processes (the file titles are given to the workers through shared memory)
+# Every shard returns all of its results, so the merged results are the same for any number of workers
+class ScorePool:
+    # Number of shards for each worker (smaller shards even out the work when some titles are pruned more than others)
+    shards_per_worker = 4
+
+    # Initialization
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+
+    # Function to find the pairs of titles and files above the score limit (the same as findPairs)
+    def findPairs(
+        self,
+        queries: List[str],
+        choices: List[str],
+        token_engine: int,
+        score_limit: int,
+        keep: Optional[int] = None,
+        keep_columns: Optional[int] = None,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]:
+        shard_size = max(
+            1, math.ceil(len(queries) / (self.workers * self.shards_per_worker))
+        )
+        starts = range(0, len(queries), shard_size)
+        # The file titles are only copied once (instead of being pickled for every shard)
+        memory = shareStrings(choices)
+        try:
+            futures = [
+                self.executor.submit(
+                    scoreShard,
+                    memory.name,
+                    queries[start : start + shard_size],
+                    token_engine,
+                    score_limit,
+                    keep,
+                    keep_columns,
+                )
+                for start in starts
+            ]
+            results = [x.result() for x in futures]
+        finally:
+            memory.close()
+            memory.unlink()
+        if len(results) == 0:
+            return findPairs(
+                queries, choices, token_engine, score_limit, keep, keep_columns
+            )
+        # Merging the shards in order (the title positions are moved back to where the shard starts)
+        return (
+            numpy.concatenate([x[0] + start for x, start in zip(results, starts)]),
+            numpy.concatenate([x[1] for x in results]),
+            numpy.concatenate([x[2] for x in results]),
+            sum(x[3] for x in results),
+        )
+
+    # Function to stop the workers
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+# Class to find the likely files for each title with character n-gram tf-idf vectors (so only those pairs are scored by the engines)
+class NgramRetriever:
+    # N-grams in more than this share of the files (and at least min_common files) are skipped, unless a title only has those
+    common = 0.02
+    min_common = 256
+
+    # Initialization
+    def __init__(self, candidates: int = 50, size: int = 3) -> None:
+        # How many files to score for each title (more candidates find more of the matches the engine would find, but take longer)
+        self.candidates = candidates
+        self.size = size
+        # The tables the candidates were found for and the candidates (title and file ids), they're found once for every stage
+        self.tables = (None, None)
+        self.pairs = None
+        self.vocabulary = {}
+
+    # Function to get the ids of the n-grams in a string (padded with spaces so the starts and ends count)
+    def ngramIds(self, string: str, add: bool) -> List[int]:
+        string = f" {string} "
+        grams = (
+            string[x : x + self.size]
+            for x in range(max(1, len(string) - self.size + 1))
+        )
+        if add:
+            return [self.vocabulary.setdefault(x, len(self.vocabulary)) for x in grams]
+        return [self.vocabulary[x] for x in grams if x in self.vocabulary]
+
+    # Function to count the n-grams of every string (sorted by string and then n-gram, n-grams of the queries that no file has are skipped)
+    def countNgrams(
+        self, strings: List[str], add: bool
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        grams = [self.ngramIds(x, add) for x in strings]
+        lengths = numpy.array([len(x) for x in grams], dtype=numpy.int64)
+        string_ids = numpy.repeat(numpy.arange(len(strings)), lengths)
+        gram_ids = numpy.fromiter(
+            itertools.chain.from_iterable(grams), dtype=numpy.int64, count=lengths.sum()
+        )
+        keys, counts = numpy.unique(
+            string_ids * max(1, len(self.vocabulary)) + gram_ids, return_counts=True
+        )
+        string_ids, gram_ids = numpy.divmod(keys, max(1, len(self.vocabulary)))
+        return (string_ids, gram_ids, counts)
+
+    # Function to index the files (the files with each n-gram and their tf-idf weights, normalized for each file)
+    def indexFiles(self, strings: List[str]) -> None:
+        self.vocabulary = {}
+        file_ids, gram_ids, counts = self.countNgrams(strings, True)
+        # Sorting the files by n-gram (so the files with each n-gram are together)
+        order = numpy.lexsort((file_ids, gram_ids))
+        file_ids, gram_ids, counts = file_ids[order], gram_ids[order], counts[order]
+        document_counts = numpy.bincount(gram_ids, minlength=len(self.vocabulary))
+        # Smoothed inverse document frequencies (n-grams in fewer files are worth more)
+        self.idf = numpy.log((1 + len(strings)) / (1 + document_counts)) + 1
+        weights = counts * self.idf[gram_ids]
+        norms = numpy.sqrt(numpy.bincount(file_ids, weights**2, minlength=len(strings)))
+        self.weights = weights / norms[file_ids]
+        self.files = file_ids
+        self.pointers = numpy.concatenate(([0], numpy.cumsum(document_counts)))
+
+    # Function to get the candidates of the remaining titles and files (the most similar files for each title that share an n-gram)
+    # The n-grams come from the strings the engines score (processed, so the punctuation and separators are spaces like the engines see them)
+    def findCandidates(
+        self, title_table: TitleTable, file_table: FileTable
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        if self.tables != (title_table, file_table):
+            self.tables = (title_table, file_table)
+            self.pairs = self.searchFiles(
+                title_table.processed(0),
+                title_table.remaining(),
+                file_table.processed(0),
+                file_table.remaining(),
+            )
+        return self.pairs
+
+    # Function to find the most similar files for each title (title and file ids, ordered by title and then similarity)
+    def searchFiles(
+        self,
+        titles: List[str],
+        title_ids: numpy.ndarray,
+        files: List[str],
+        file_ids: numpy.ndarray,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        rows, columns = [], []
+        if len(title_ids) == 0 or len(file_ids) == 0:
+            return (numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.intp))
+        # Every file is a candidate when there's room for all of them (so the results are the same as without candidates)
+        if self.candidates >= len(file_ids):
+            return (
+                numpy.repeat(title_ids, len(file_ids)),
+                numpy.tile(file_ids, len(title_ids)),
+            )
+        self.indexFiles([files[x] for x in file_ids])
+        query_rows, gram_ids, counts = self.countNgrams(
+            [titles[x] for x in title_ids], False
+        )
+        sizes = self.pointers[gram_ids + 1] - self.pointers[gram_ids]
+        # Skipping the common n-grams (they're in so many files they barely change the similarity)
+        common = sizes > max(self.min_common, self.common * len(file_ids))
+        rare = numpy.bincount(query_rows[~common], minlength=len(title_ids)) > 0
+        kept = ~common | ~rare[query_rows]
+        query_rows, gram_ids, counts, sizes = (
+            query_rows[kept],
+            gram_ids[kept],
+            counts[kept],
+            sizes[kept],
+        )
+        starts = self.pointers[gram_ids]
+        query_weights = counts * self.idf[gram_ids]
+        norms = numpy.sqrt(
+            numpy.bincount(query_rows, query_weights**2, minlength=len(title_ids))
+        )
+        query_weights = query_weights / norms[query_rows]
+        # The titles are searched in chunks (limited by the number of n-gram and file products)
+        row_ends = numpy.cumsum(
+            numpy.bincount(query_rows, sizes, minlength=len(title_ids))
+        )
+        start = 0
+        while start < len(title_ids):
+            done = row_ends[start - 1] if start > 0 else 0
+            end = numpy.searchsorted(row_ends, done + SCORE_CHUNK_CELLS, "right")
+            end = min(max(end, start + 1), len(title_ids))
+            first, last = numpy.searchsorted(query_rows, [start, end])
+            # The files with each n-gram of the titles (a sparse matrix product of the title and file vectors)
+            chunk_sizes = sizes[first:last]
+            offsets = numpy.repeat(
+                starts[first:last] - numpy.cumsum(chunk_sizes) + chunk_sizes,
+                chunk_sizes,
+            ) + numpy.arange(chunk_sizes.sum())
+            keys, pairs = numpy.unique(
+                numpy.repeat(query_rows[first:last], chunk_sizes) * len(file_ids)
+                + self.files[offsets],
+                return_inverse=True,
+            )
+            similarity = numpy.bincount(
+                pairs,
+                numpy.repeat(query_weights[first:last], chunk_sizes)
+                * self.weights[offsets],
+            )
+            row, column = numpy.divmod(keys, len(file_ids))
+            # Keeping the most similar files of each title (the similarity is at most 1, ties by the lowest file)
+            order = numpy.argsort(row * 2.0 - similarity, kind="stable")
+            row, column = row[order], column[order]
+            best = groupRanks(row) < self.candidates
+            rows.append(title_ids[row[best]])
+            columns.append(file_ids[column[best]])
+            start = end
+        return (numpy.concatenate(rows), numpy.concatenate(columns))
+
+
+# Class to score every pair of titles and files into a memory mapped matrix on disk (one byte per rounded score)
+# The scores are made in tiles, and the results are read back a block of titles at a time, so the memory is bounded by the tile size
+class ScoreMap:
+    # Initialization
+    def __init__(self, directory: pathlib.Path, tile_size: int = 2048) -> None:
+        self.directory = directory
+        self.tile_size = tile_size
+
+    # Print information
+    def __str__(self) -> str:
+        return f"Directory: {self.directory}\nTile size: {self.tile_size}"
+
+    # Function to get the best files for every title and the best titles for every file (the strings should already be processed)
+    def findResults(
+        self,
+        queries: List[str],
+        choices: List[str],
+        token_engine: int,
+        score_limit: int,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        handle, map_path = tempfile.mkstemp(suffix=".scores", dir=self.directory)
+        os.close(handle)
+        try:
+            scores = numpy.memmap(
+                map_path,
+                dtype=numpy.uint8,
+                mode="w+",
+                shape=(len(queries), len(choices)),
+            )
+            self.fillScores(scores, queries, choices, token_engine, score_limit)
+            results = self.readResults(
+                scores, queries, choices, token_engine, score_limit
+            )
+            del scores
+        finally:
+            os.remove(map_path)
+        return results
+
+    # Function to score the pairs a tile at a time (the rounded scores are stored, scores that round below the score limit are 0)
+    def fillScores(
+        self,
+        scores: numpy.memmap,
+        queries: List[str],
+        choices: List[str],
+        token_engine: int,
+        score_limit: int,
+    ) -> None:
+        for row in range(0, len(queries), self.tile_size):
+            for column in range(0, len(choices), self.tile_size):
+                tile = rapidfuzz.process.cdist(
+                    queries[row : row + self.tile_size],
+                    choices[column : column + self.tile_size],
+                    scorer=SCORE_ENGINES[token_engine],
+                    score_cutoff=max(0, score_limit - 0.5),
+                    dtype=numpy.float64,
+                    workers=-1,
+                )
+                scores[row : row + self.tile_size, column : column + self.tile_size] = (
+                    numpy.round(tile)
+                )
+        scores.flush()
+
+    # Function to read the results from the map in blocks of titles (each block is read once for the titles and the files)
+    def readResults(
+        self,
+        scores: numpy.memmap,
+        queries: List[str],
+        choices: List[str],
+        token_engine: int,
+        score_limit: int,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        title_count, file_count = scores.shape
+        title_limit, file_limit = TitleTable.result_limit, FileTable.result_limit
+        block_size = max(1, self.tile_size**2 // file_count)
+        title_files, title_scores = [], []
+        # The best titles of every file so far (scores below the score limit are -1 so they're always last)
+        file_titles = numpy.full((file_count, file_limit), -1, dtype=numpy.intp)
+        file_scores = numpy.full((file_count, file_limit), -1, dtype=numpy.int16)
+        for start in range(0, title_count, block_size):
+            block = numpy.array(scores[start : start + block_size], dtype=numpy.int16)
+            block[block < score_limit] = -1
+            # The title results are ordered by the exact scores, but any of them has a rounded score of at least the third best one
+            # So only the pairs tied with (or above) the third best rounded score are scored again
+            if file_count > title_limit:
+                third = numpy.partition(block, file_count - title_limit, axis=1)[
+                    :, file_count - title_limit
+                ]
+            else:
+                third = block.min(axis=1)
+            rows, columns = numpy.nonzero(
+                block >= numpy.maximum(third, score_limit)[:, None]
+            )
+            exact = numpy.zeros(len(rows), dtype=numpy.float64)
+            if len(rows) != 0:
+                exact = rapidfuzz.process.cpdist(
+                    [queries[x] for x in (rows + start).tolist()],
+                    [choices[x] for x in columns.tolist()],
+                    scorer=SCORE_ENGINES[token_engine],
+                    dtype=numpy.float64,
+                    workers=-1,
+                )
+            indices, best = sparseTopIndices(
+                rows, columns, exact, len(block), title_limit
+            )
+            title_files.append(indices)
+            title_scores.append(numpy.round(best).astype(numpy.int64))
+            # Merging the best titles of this block into the best titles of every file (the earlier titles win the ties)
+            rows, columns = numpy.nonzero(block >= 0)
+            best, block_scores = sparseTopIndices(
+                columns, rows, block[rows, columns], file_count, file_limit
+            )
+            block_scores[best < 0] = -1
+            merged_titles = numpy.concatenate([file_titles, best + start], axis=1)
+            merged_scores = numpy.concatenate([file_scores, block_scores], axis=1)
+            order = numpy.argsort(-merged_scores, axis=1, kind="stable")[:, :file_limit]
+            file_titles = numpy.take_along_axis(merged_titles, order, axis=1)
+            file_scores = numpy.take_along_axis(merged_scores, order, axis=1)
+        # Results below the score limit are empty
+        file_titles[file_scores < 0] = -1
+        return (
+            numpy.concatenate(title_files),
+            numpy.concatenate(title_scores),
+            file_titles,
+            numpy.maximum(file_scores, 0).astype(numpy.int64),
+        )
+
+
+# Class to save the progress of the stages so a stopped run can be resumed (an npz file that's replaced all at once)
+# The progress is saved after every stage, and inside a stage every interval (with the pairs of the titles scored so far)
+class Checkpoint:
+    # Number of title and file pairs scored between the checks of the interval
+    block_cells = 2**22
+
+    # Initialization
+    def __init__(
+        self,
+        checkpoint_path: pathlib.Path,
+        interval: float = 600.0,
+        resume: bool = False,
+    ) -> None:
+        self.checkpoint_path = checkpoint_path
+        self.interval = interval
+        self.resume = resume
+        # The inputs and settings of the run (a checkpoint can only be resumed by the same run)
+        self.meta = {}
+        self.saved = time.monotonic()
+        # The progress inside the stage that's being resumed (taken by the stage the first time it's scored)
+        self.progress = None
+
+    # Print information
+    def __str__(self) -> str:
+        return f"Path: {self.checkpoint_path}\nInterval: {self.interval}\nResume: {self.resume}"
+
+    # Function to check if it's time to save the progress inside a stage
+    def due(self) -> bool:
+        return time.monotonic() - self.saved >= self.interval
+
+    # Function to get how many titles are scored between the checks of the interval
+    def blockSize(self, file_count: int) -> int:
+        return max(1, self.block_cells // max(1, file_count))
+
+    # Function to save the progress (the stage to start from, and the pairs scored so far if it's inside the stage)
+    def save(
+        self,
+        file_table: FileTable,
+        title_table: TitleTable,
+        stage: int,
+        position: Optional[Tuple[int, int]] = None,
+        pairs: Optional[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = None,
+    ) -> None:
+        meta = dict(self.meta, stage=stage, position=position)
+        arrays = {
+            "meta": numpy.array(json.dumps(meta)),
+            "title_used": title_table.used,
+            "match_file": title_table.match_file,
+            "match_score": title_table.match_score,
+            "match_iteration": title_table.match_iteration,
+            "match_engine": title_table.match_engine,
+            "file_used": file_table.used,
+        }
+        if pairs is not None:
+            arrays["rows"], arrays["columns"], arrays["scores"] = pairs
+        # Writing to a temporary file first so a stopped run never leaves a partial checkpoint
+        temp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(temp_path, "wb") as out_file:
+            numpy.savez(out_file, **arrays)
+        os.replace(temp_path, self.checkpoint_path)
+        self.saved = time.monotonic()
+        logger.info(
+            f'Saved the checkpoint at "{self.checkpoint_path}" (stage {stage}{"" if position is None else f", split {position[0]} from title {position[1]}"})'
+        )
+
+    # Function to restore the tables from the checkpoint (returns the stage to start from)
+    def load(self, file_table: FileTable, title_table: TitleTable) -> int:
+        with numpy.load(self.checkpoint_path) as saved:
+            meta = json.loads(str(saved["meta"]))
+            # The checkpoint has to come from the same titles, files, and settings
+            if {x: meta.get(x) for x in self.meta} != self.meta:
+                logger.critical(
+                    f'The checkpoint at "{self.checkpoint_path}" is from different titles, files, or settings'
+                )
+                sys.exit()
+            # The matched titles aren't marked as used yet, so they're added to the input data frame again
+            title_table.match_file[:] = saved["match_file"]
+            title_table.match_score[:] = saved["match_score"]
+            title_table.match_iteration[:] = saved["match_iteration"]
+            title_table.match_engine[:] = saved["match_engine"]
+            title_table.used[:] = saved["title_used"] & (title_table.match_file < 0)
+            file_table.used[:] = saved["file_used"]
+            if meta["position"] is not None:
+                self.progress = (
+                    meta["stage"],
+                    tuple(meta["position"]),
+                    (saved["rows"], saved["columns"], saved["scores"]),
+                )
+        logger.info(
+            f'Resuming from the checkpoint at "{self.checkpoint_path}" (stage {meta["stage"]})'
+        )
+        return meta["stage"]
+
+    # Function to take the progress of a stage (if the stage is the one being resumed)
+    def takeProgress(
+        self, stage: int
+    ) -> Optional[
+        Tuple[Tuple[int, int], Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    ]:
+        if self.progress is None or self.progress[0] != stage:
+            return None
+        progress = self.progress[1:]
+        self.progress = None
+        return progress
+
+    # Function to remove the checkpoint (once the output is written)
+    def remove(self) -> None:
+        if checkPath(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+            logger.info(f'Removed the checkpoint at "{self.checkpoint_path}"')
+
+
+# Class to record the time, counts, and memory of each step of a run (written as json or a prometheus textfile)
+class RunMetrics:
+    # Prefix for the prometheus metric names
+    prefix = "title_matcher"
+
+    # Initialization
+    def __init__(self) -> None:
+        # The time of every step (with labels like the stage)
+        self.steps = []
+        # Counts and values by name and labels
+        self.values = {}
+        # Labels added to everything that's recorded (like the score limit of a sweep)
+        self.labels = {}
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    # Function to add labels to everything that's recorded inside it
+    @contextlib.contextmanager
+    def labelled(self, **labels) -> Iterator[None]:
+        old_labels = self.labels
+        self.labels = dict(old_labels, **{x: str(y) for x, y in labels.items()})
+        try:
+            yield
+        finally:
+            self.labels = old_labels
+
+    # Function to get the key of a value (with the added labels)
+    def key(self, name: str, labels: dict) -> tuple:
+        labels = dict(self.labels, **{x: str(y) for x, y in labels.items()})
+        return (name, tuple(sorted(labels.items())))
+
+    # Function to time a step (wall and cpu time, and the peak memory after it)
+    @contextlib.contextmanager
+    def timer(self, step: str, **labels) -> Iterator[None]:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        step_labels = dict(self.key(step, labels)[1])
+        try:
+            yield
+        finally:
+            self.steps.append(
+                {
+                    "step": step,
+                    "labels": step_labels,
+                    "wall_seconds": time.perf_counter() - wall_start,
+                    "cpu_seconds": time.process_time() - cpu_start,
+                    "peak_rss_bytes": peakRss(),
+                }
+            )
+
+    # Function to add to a count
+    def count(self, name: str, value: int, **labels) -> None:
+        key = self.key(name, labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    # Function to set a value
+    def set(self, name: str, value: int, **labels) -> None:
+        self.values[self.key(name, labels)] = value
+
+    # Function to get the totals for the whole run
+    def totals(self) -> dict:
+        return {
+            "wall_seconds": time.perf_counter() - self.wall_start,
+            "cpu_seconds": time.process_time() - self.cpu_start,
+            "peak_rss_bytes": peakRss(),
+        }
+
+    # Function to get the metrics as a json object
+    def toJson(self) -> dict:
+        return {
+            "run": self.totals(),
+            "steps": self.steps,
+            "values": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.values.items()
+            ],
+        }
+
+    # Function to get the metrics in the prometheus text format
+    def toPrometheus(self) -> str:
+        samples = collections.defaultdict(list)
+        for name, value in self.totals().items():
+            samples[(f"run_{name}", "gauge")].append(({}, value))
+        # Steps that ran more than once with the same labels (like every batch of watch mode) are added together
+        step_totals = {}
+        for step in self.steps:
+            labels = tuple(sorted(dict(step["labels"], step=step["step"]).items()))
+            for name in ["wall_seconds", "cpu_seconds"]:
+                key = (f"step_{name}", labels)
+                step_totals[key] = step_totals.get(key, 0) + step[name]
+        for (name, labels), value in step_totals.items():
+            samples[(name, "gauge")].append((dict(labels), value))
+        for (name, labels), value in self.values.items():
+            samples[(name, "gauge")].append((dict(labels), value))
+        lines = []
+        for (name, kind), metric_samples in samples.items():
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            for labels, value in metric_samples:
+                label_text = ",".join(f'{x}="{y}"' for x, y in sorted(labels.items()))
+                if label_text:
+                    label_text = "{" + label_text + "}"
+                lines.append(f"{self.prefix}_{name}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Function to write the metrics (a prometheus textfile if the path ends in .prom, otherwise json)
+    def write(self, out_path: pathlib.Path) -> None:
+        if out_path.suffix == ".prom":
+            text = self.toPrometheus()
+        else:
+            text = json.dumps(self.toJson(), indent=2)
+        # Writing to a temporary file first so a reader never sees a partial file
+        temp_path = out_path.with_name(out_path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as out_file:
+            out_file.write(text)
+        os.replace(temp_path, out_path)
+        logger.info(f'Wrote the metrics at "{out_path}"')
+
+
+# Inotify events that change the entries of a directory: created, deleted, moved from, and moved to (from sys/inotify.h)
+WATCH_EVENTS = 0x100 | 0x200 | 0x40 | 0x80
+# Inotify flags for when events were lost (the queue was full) and when a watch was removed (the directory is gone)
+WATCH_OVERFLOW = 0x4000
+WATCH_IGNORED = 0x8000
+
+
+# Class to watch the files directory for new, renamed, and removed entries (uses inotify on linux, otherwise the directories are polled)
+class DirectoryWatcher:
+    # Seconds to wait for more events after the first one (so a batch of files is matched at once)
+    settle_time = 0.25
+
+    # Initialization
+    def __init__(
+        self,
+        file_path: pathlib.Path,
+        depth: int = 0,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        poll_interval: float = 2.0,
+        use_inotify: bool = True,
+    ) -> None:
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.poll_interval = poll_interval
+        # The levels left to search below each directory (-1 is every level)
+        self.directories = {str(file_path): depth}
+        # The entries in each directory by path (whether it's a file and its inode, to tell when it was renamed)
+        self.entries = {}
+        # The inotify watch for each directory and the directory for each watch
+        self.watched = {}
+        self.watches = {}
+        self.libc = None
+        self.fd = -1
+        if use_inotify:
+            self.openInotify()
+        # Taking the first snapshot of the entries (the watches are added before each directory is read)
+        self.rescan([str(file_path)])
+
+    # Function to start inotify (stays polling if it isn't available)
+    def openInotify(self) -> None:
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd >= 0:
+            self.libc = libc
+            self.fd = fd
+
+    # Function to get how the directories are being watched
+    def method(self) -> str:
+        return "inotify" if self.fd >= 0 else f"polling every {self.poll_interval}s"
+
+    # Function to add an inotify watch to a directory
+    def addWatch(self, directory: str) -> None:
+        if self.fd < 0 or directory in self.watched:
+            return
+        watch = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), WATCH_EVENTS
+        )
+        if watch >= 0:
+            self.watched[directory] = watch
+            self.watches[watch] = directory
+        elif ctypes.get_errno() != errno.ENOENT:
+            # Out of watches (or memory), so every directory is polled instead (a missing directory is found by the rescan)
+            logger.warning(
+                f'Couldn\'t watch "{directory}" ({os.strerror(ctypes.get_errno())}), polling instead'
+            )
+            self.close()
+
+    # Function to stop tracking a directory and every directory in it (their entries are added to the old entries)
+    def removeDirectory(self, directory: str, old: dict) -> None:
+        for known in list(self.directories):
+            if known == directory or known.startswith(directory + os.sep):
+                del self.directories[known]
+                old.update(self.entries.pop(known, {}))
+                watch = self.watched.pop(known, None)
+                if watch is not None:
+                    self.watches.pop(watch, None)
+                    self.libc.inotify_rm_watch(self.fd, watch)
+
+    # Function to read the directories again and find what changed (new directories are read as well)
+    def rescan(self, directories: Iterable[str]) -> Tuple[
+        List[Tuple[str, bool]],
+        List[Tuple[str, bool]],
+        List[Tuple[str, str, bool]],
+    ]:
+        old = {}
+        new = {}
+        read = set()
+        pending = collections.deque(directories)
+        while len(pending) != 0:
+            directory = pending.popleft()
+            # Skip directories that were already read (or removed) in this rescan
+            if directory not in self.directories or directory in read:
+                continue
+            read.add(directory)
+            old.update(self.entries.get(directory, {}))
+            self.addWatch(directory)
+            try:
+                items, subdirectories = scanDirectory(
+                    directory, self.directories[directory], self.include, self.exclude
+                )
+            except OSError:
+                self.removeDirectory(directory, old)
+                continue
+            entries = {}
+            for path, is_file in items:
+                try:
+                    entries[path] = (is_file, os.lstat(path).st_ino)
+                except OSError:
+                    # It was removed while the directory was being read
+                    continue
+            self.entries[directory] = entries
+            new.update(entries)
+            # Start tracking the new subdirectories and stop tracking the ones that are gone
+            current = set()
+            for subdirectory, sub_depth in subdirectories:
+                current.add(subdirectory)
+                if subdirectory not in self.directories:
+                    self.directories[subdirectory] = sub_depth
+                    pending.append(subdirectory)
+            for known in list(self.directories):
+                if os.path.dirname(known) == directory and known not in current:
+                    self.removeDirectory(known, old)
+        created = [x for x in new if x not in old]
+        removed = [x for x in old if x not in new]
+        # Entries that were removed and created with the same inode were renamed (or moved)
+        sources = {old[x]: x for x in removed}
+        renamed = []
+        for path in created:
+            source = sources.pop(new[path], None)
+            if source is not None:
+                renamed.append((source, path))
+        moved = set(x for pair in renamed for x in pair)
+        return (
+            [(x, new[x][0]) for x in created if x not in moved],
+            [(x, old[x][0]) for x in removed if x not in moved],
+            [(x, y, new[y][0]) for x, y in renamed],
+        )
+
+    # Function to read the inotify events (waits for the first one, then reads until they stop coming)
+    def readEvents(self) -> List[str]:
+        directories = {}
+        timeout = None
+        while len(select.select([self.fd], [], [], timeout)[0]) != 0:
+            events = os.read(self.fd, 65536)
+            offset = 0
+            while offset < len(events):
+                watch, mask, _, length = struct.unpack_from("iIII", events, offset)
+                offset += 16 + length
+                if mask & WATCH_OVERFLOW:
+                    # Events were lost, so every directory is read again
+                    directories.update(dict.fromkeys(self.directories))
+                elif watch in self.watches:
+                    directories[self.watches[watch]] = None
+                    if mask & WATCH_IGNORED:
+                        del self.watched[self.watches.pop(watch)]
+            timeout = self.settle_time
+        return list(directories)
+
+    # Function to wait until entries are created, removed, or renamed
+    def waitForChanges(
+        self,
+    ) -> Tuple[
+        List[Tuple[str, bool]],
+        List[Tuple[str, bool]],
+        List[Tuple[str, str, bool]],
+    ]:
+        while True:
+            if self.fd >= 0:
+                directories = self.readEvents()
+            else:
+                time.sleep(self.poll_interval)
+                directories = list(self.directories)
+            changes = self.rescan(directories)
+            if any(len(x) != 0 for x in changes):
+                return changes
+
+    # Function to get every entry that's being watched
+    def items(self) -> List[Tuple[str, bool]]:
+        return [
+            (x, y[0]) for entries in self.entries.values() for x, y in entries.items()
+        ]
+
+    # Function to stop inotify
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+        self.fd = -1
+        self.watched = {}
+        self.watches = {}
+
+
+# Class to hold the files for answering title queries (the files are normalized and processed once, and the answers are cached)
+class MatchIndex:
+    # Initialization
+    def __init__(
+        self,
+        file_df: pandas.DataFrame,
+        normalizer: Optional[Normalizer] = None,
+        cache_size: int = 4096,
+    ) -> None:
+        self.normalizer = normalizer
+        self.file_table = FileTable(file_df, normalizer=normalizer)
+        # Processing the files for every engine now (so no query has to wait for it)
+        for token_engine in SCORE_ENGINES:
+            self.file_table.processed(token_engine)
+        self.search = functools.lru_cache(maxsize=cache_size)(self.searchTitle)
+
+    # Function to find the best files for a title (a tuple of file ids and scores, best first)
+    def searchTitle(
+        self, title: str, token_engine: int, limit: int, score_limit: int
+    ) -> Tuple[Tuple[int, int], ...]:
+        queries = processStrings(
+            normalizeStrings([title], self.normalizer),
+            ENGINE_FORMS[token_engine],
+            True,
+        )
+        rows, columns, scores, _ = findPairs(
+            queries,
+            self.file_table.processed(token_engine),
+            token_engine,
+            score_limit,
+            keep=limit,
+        )
+        # Ordered by score, ties by the lowest file id (the same as the title results)
+        best, best_scores = sparseTopIndices(rows, columns, scores, 1, limit)
+        return tuple(
+            (x, round(y))
+            for x, y in zip(best[0].tolist(), best_scores[0].tolist())
+            if x >= 0
+        )
+
+    # Function to answer a title query with the file names, paths, and scores
+    def query(
+        self, title: str, token_engine: int = 0, limit: int = 5, score_limit: int = 0
+    ) -> dict:
+        candidates = [
+            {
+                "name": self.file_table.name[x],
+                "path": str(self.file_table.filePath(x)),
+                "score": y,
+            }
+            for x, y in self.search(title, token_engine, limit, score_limit)
+        ]
+        return {"title": title, "engine": token_engine, "candidates": candidates}
+
+    # Function to get the size of the index and how well the cache is doing
+    def stats(self) -> dict:
+        cache = self.search.cache_info()
+        return {
+            "files": len(self.file_table.name),
+            "cache": {
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "size": cache.currsize,
+                "max_size": cache.maxsize,
+            },
+        }
+
+
+# Class to answer the title queries over http (each request is handled on its own thread)
+class MatchHandler(http.server.BaseHTTPRequestHandler):
+    # The index that answers the queries (set before the server is started)
+    index = None
+
+    # Function to send a json response
+    def sendJson(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Function to answer a GET request (/match?title=...&engine=...&limit=...&score_limit=... or /stats)
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/stats":
+            self.sendJson(200, self.index.stats())
+            return
+        if url.path != "/match":
+            self.sendJson(404, {"error": f'There\'s nothing at "{url.path}"'})
+            return
+        values = {x: y[-1] for x, y in urllib.parse.parse_qs(url.query).items()}
+        try:
+            title, options = parseMatchQuery(values, "title")
+        except ValueError as error:
+            self.sendJson(400, {"error": str(error)})
+            return
+        self.sendJson(200, self.index.query(title, *options))
+
+    # Function to answer a POST request to /match (a json object with a list of titles and the same options)
+    def do_POST(self) -> None:
+        if urllib.parse.urlsplit(self.path).path != "/match":
+            self.sendJson(404, {"error": f'There\'s nothing at "{self.path}"'})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            values = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(values, dict):
+                raise ValueError("The body must be a json object")
+            titles, options = parseMatchQuery(values, "titles")
+        except ValueError as error:
+            self.sendJson(400, {"error": str(error)})
+            return
+        self.sendJson(200, {"results": [self.index.query(x, *options) for x in titles]})
+
+    # Function to log the requests (only shown when debugging)
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+# Function to get the peak memory of the process in bytes (0 if it can't be found)
+def peakRss() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives the peak in kilobytes and macOS gives it in bytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+# Function to time a step if metrics are being recorded
+def timeStep(metrics: Optional[RunMetrics], step: str, **labels):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.timer(step, **labels)
+
+
+# Function to add labels to the metrics recorded inside it if metrics are being recorded
+def labelStep(metrics: Optional[RunMetrics], **labels):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.labelled(**labels)
+
+
+# Function to get which rows of a data frame are fresh (new since the last run)
+def createFreshMask(
+    df: pandas.DataFrame, fresh: Optional[pandas.Series]
+) -> numpy.ndarray:
+    if fresh is None:
+        return numpy.ones(len(df), dtype=bool)
+    return fresh.reindex(df.index, fill_value=True).to_numpy(dtype=bool)
 
 
 # Function to check if a path exists
@@ -169,27 +1446,262 @@ def checkArguments(cli_args: argparse.Namespace) -> UserPaths:
         output_csv = cli_args.output_path
     # Checking the the input csv exists and that the file directory exists
     good_paths = True
-    if not checkPath(input_csv):
+    # The server doesn't use the input file (the titles come from the queries)
+    if cli_args.serve is None and not checkPath(input_csv):
         good_paths = False
         logger.error(f'The input file at "{input_csv}" does not exist')
+    file_listing = None
     if not checkPath(files_path):
         good_paths = False
         logger.error(f'The input directory at "{files_path}" does not exist')
-    elif not any(files_path.iterdir()):
-        # Check that the directory isn't empty
-        good_paths = False
-        logger.error(f'The input directory at "{files_path}" is empty')
+    else:
+        # Check that the directory isn't empty (the listing is kept for reading the files later)
+        try:
+            with os.scandir(files_path) as entries:
+                file_listing = list(entries)
+        except OSError:
+            file_listing = []
+            logger.error(f'The input directory at "{files_path}" couldn\'t be read')
+        if len(file_listing) == 0:
+            good_paths = False
+            logger.error(f'The input directory at "{files_path}" is empty')
     # Checking that the output file is in a directory that exists
     if not checkPath(output_csv.parent):
         good_paths = False
         logger.error(f'The output directory at "{output_csv.parent}" does not exist')
+    # Checking that the cache file is in a directory that exists
+    if cli_args.cache_path is not None and not checkPath(cli_args.cache_path.parent):
+        good_paths = False
+        logger.error(
+            f'The cache directory at "{cli_args.cache_path.parent}" does not exist'
+        )
+    # Checking that the manifest file is in a directory that exists
+    if cli_args.manifest_path is not None and not checkPath(
+        cli_args.manifest_path.parent
+    ):
+        good_paths = False
+        logger.error(
+            f'The manifest directory at "{cli_args.manifest_path.parent}" does not exist'
+        )
+    # Checking the scanning options
+    if cli_args.depth < -1:
+        good_paths = False
+        logger.error(f"The depth must be -1 or more, not {cli_args.depth}")
+    if cli_args.scan_threads < 1:
+        good_paths = False
+        logger.error(f"The scan threads must be 1 or more, not {cli_args.scan_threads}")
+    if cli_args.workers < 1:
+        good_paths = False
+        logger.error(f"The workers must be 1 or more, not {cli_args.workers}")
+    # Checking the shard (K/N, where K is 1 to N)
+    shard = None
+    if cli_args.shard is not None:
+        try:
+            shard = tuple(int(x) for x in cli_args.shard.split("/"))
+        except ValueError:
+            shard = ()
+        if len(shard) != 2 or not 1 <= shard[0] <= shard[1]:
+            good_paths = False
+            logger.error(
+                f'The shard must be K/N with K from 1 to N, not "{cli_args.shard}"'
+            )
+    # Checking the partial results to merge
+    merge_paths = cli_args.merge or []
+    for merge_path in merge_paths:
+        if not checkPath(merge_path):
+            good_paths = False
+            logger.error(f'The partial results at "{merge_path}" do not exist')
+    if shard is not None and len(merge_paths) > 0:
+        good_paths = False
+        logger.error("A shard can't be scored and merged at the same time")
+    # Checking that the metrics file is in a directory that exists
+    if cli_args.metrics_path is not None and not checkPath(
+        cli_args.metrics_path.parent
+    ):
+        good_paths = False
+        logger.error(
+            f'The metrics directory at "{cli_args.metrics_path.parent}" does not exist'
+        )
+    if (shard is not None or len(merge_paths) > 0) and (
+        cli_args.manifest_path is not None or cli_args.cache_path is not None
+    ):
+        good_paths = False
+        logger.error("The manifest and cache can't be used with shards")
+    # Checking the watch options
+    if cli_args.watch and (shard is not None or len(merge_paths) > 0):
+        good_paths = False
+        logger.error("The directory can't be watched with shards")
+    if cli_args.poll_interval <= 0:
+        good_paths = False
+        logger.error(
+            f"The poll interval must be more than 0, not {cli_args.poll_interval}"
+        )
+    # Checking the server address (HOST:PORT or just PORT)
+    serve = None
+    if cli_args.serve is not None:
+        host, _, port = cli_args.serve.rpartition(":")
+        try:
+            serve = (host or "127.0.0.1", int(port))
+        except ValueError:
+            serve = ("", -1)
+        if not 0 <= serve[1] <= 65535:
+            good_paths = False
+            logger.error(
+                f'The server address must be HOST:PORT or PORT, not "{cli_args.serve}"'
+            )
+        if cli_args.watch or shard is not None or len(merge_paths) > 0:
+            good_paths = False
+            logger.error("The server can't be used with --watch, --shard, or --merge")
+    if cli_args.query_cache_size < 0:
+        good_paths = False
+        logger.error(
+            f"The query cache size must be 0 or more, not {cli_args.query_cache_size}"
+        )
+    # Checking the n-gram candidates
+    if cli_args.candidates < 0:
+        good_paths = False
+        logger.error(f"The candidates must be 0 or more, not {cli_args.candidates}")
+    if cli_args.ngram_size < 1:
+        good_paths = False
+        logger.error(f"The n-gram size must be 1 or more, not {cli_args.ngram_size}")
+    if cli_args.candidates > 0 and (
+        cli_args.cache_path is not None
+        or cli_args.single_pass
+        or shard is not None
+        or len(merge_paths) > 0
+    ):
+        good_paths = False
+        logger.error(
+            "The candidates can't be used with the cache, --single_pass, --shard, or --merge"
+        )
+    # Checking the score map (the directory has to exist, the maps are removed after each stage)
+    if cli_args.score_map is not None and not cli_args.score_map.is_dir():
+        good_paths = False
+        logger.error(
+            f'The score map directory at "{cli_args.score_map}" does not exist'
+        )
+    if cli_args.tile_size < 1:
+        good_paths = False
+        logger.error(f"The tile size must be 1 or more, not {cli_args.tile_size}")
+    if cli_args.score_map is not None and (
+        cli_args.cache_path is not None
+        or cli_args.manifest_path is not None
+        or cli_args.single_pass
+        or cli_args.shard is not None
+        or len(merge_paths) > 0
+        or cli_args.candidates > 0
+        or cli_args.watch
+        or cli_args.serve is not None
+        or cli_args.assignment != "greedy"
+    ):
+        good_paths = False
+        logger.error(
+            "The score map can only be used with the greedy assignment (not with the cache, manifest, --single_pass, --shard, --merge, --candidates, --watch, or --serve)"
+        )
+    # Checking the score limits (more than one is a sweep, from the highest to the lowest)
+    score_limits = sorted(
+        set(itertools.chain.from_iterable(cli_args.score_limit)), reverse=True
+    )
+    if len(score_limits) > 1 and (
+        cli_args.cache_path is not None
+        or cli_args.manifest_path is not None
+        or shard is not None
+        or len(merge_paths) > 0
+        or cli_args.candidates > 0
+        or cli_args.score_map is not None
+        or cli_args.watch
+        or cli_args.serve is not None
+    ):
+        good_paths = False
+        logger.error(
+            "More than one score limit can't be used with the cache, manifest, --shard, --merge, --candidates, --score_map, --watch, or --serve"
+        )
+    # Checking the checkpoint (only the plain stages can be resumed)
+    if cli_args.checkpoint_path is not None and not checkPath(
+        cli_args.checkpoint_path.parent
+    ):
+        good_paths = False
+        logger.error(
+            f'The checkpoint directory at "{cli_args.checkpoint_path.parent}" does not exist'
+        )
+    if cli_args.checkpoint_interval <= 0:
+        good_paths = False
+        logger.error(
+            f"The checkpoint interval must be more than 0, not {cli_args.checkpoint_interval}"
+        )
+    if cli_args.resume and (
+        cli_args.checkpoint_path is None or not checkPath(cli_args.checkpoint_path)
+    ):
+        good_paths = False
+        logger.error("There's no checkpoint to resume (give it with --checkpoint_path)")
+    if cli_args.checkpoint_path is not None and (
+        cli_args.cache_path is not None
+        or cli_args.manifest_path is not None
+        or cli_args.single_pass
+        or shard is not None
+        or len(merge_paths) > 0
+        or cli_args.candidates > 0
+        or cli_args.score_map is not None
+        or cli_args.watch
+        or cli_args.serve is not None
+        or len(score_limits) > 1
+    ):
+        good_paths = False
+        logger.error(
+            "The checkpoint can't be used with the cache, manifest, --single_pass, --shard, --merge, --candidates, --score_map, --watch, --serve, or more than one score limit"
+        )
+    # Checking the tag patterns (the media tags are added after the user's patterns)
+    strip_tags = cli_args.strip_tags or []
+    for pattern in strip_tags:
+        try:
+            re.compile(pattern)
+        except re.error as error:
+            good_paths = False
+            logger.error(f'The tag pattern "{pattern}" is invalid: {error}')
+    if cli_args.strip_media_tags:
+        strip_tags = strip_tags + MEDIA_TAGS
     # Close if there was an invalid path
     if not good_paths:
         logger.critical("Fix the errors in your files")
         sys.exit()
     # Create the class to store the files
     return UserPaths(
-        input_csv, files_path, output_csv, cli_args.score_limit, cli_args.score_engine
+        input_csv,
+        files_path,
+        output_csv,
+        score_limits[-1],
+        cli_args.score_engine,
+        cli_args.cache_path,
+        cli_args.cache_size,
+        cli_args.manifest_path,
+        cli_args.depth,
+        cli_args.include or [],
+        cli_args.exclude or [],
+        cli_args.scan_threads,
+        cli_args.single_pass,
+        cli_args.fold_unicode,
+        cli_args.collapse_separators,
+        strip_tags,
+        cli_args.workers,
+        shard,
+        merge_paths,
+        cli_args.metrics_path,
+        cli_args.profile,
+        cli_args.assignment,
+        cli_args.watch,
+        cli_args.poll_interval,
+        serve,
+        cli_args.query_cache_size,
+        cli_args.candidates,
+        cli_args.ngram_size,
+        cli_args.score_map,
+        cli_args.tile_size,
+        score_limits,
+        cli_args.checkpoint_path,
+        cli_args.checkpoint_interval,
+        cli_args.resume,
+        # The directory is listed again while watching (so nothing added before the watch starts is missed)
+        None if cli_args.watch else file_listing,
     )
 
 
@@ -197,11 +1709,10 @@ def checkArguments(cli_args: argparse.Namespace) -> UserPaths:
 def readCsv(csv_path: pathlib.Path) -> pandas.DataFrame:
     # Try to open the csv file
     try:
-        # try to read the csv
-        df = pandas.read_csv(csv_path, header=None, usecols=[0, 1], index_col=None)
-        return df[
-            1:
-        ]  # Not returning the first row (couldn't get the header argument to use it)
+        # try to read the csv (the first row is the header, and everything is read as text so titles like 1984 stay strings)
+        return pandas.read_csv(
+            csv_path, header=0, usecols=[0, 1], index_col=None, dtype=str
+        )
     except:
         logger.error(f'The file at "{csv_path}" couldn\'t be read')
         sys.exit()
@@ -221,26 +1732,225 @@ def writeCsv(out_path: pathlib, output_df: pandas.DataFrame) -> None:
         sys.exit()
 
 
-# Function to create the initial data frame
-def createInitialDataframes(
-    input_file: pathlib.Path, file_path: pathlib.Path
-) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
-    # Getting the input csv data in a data frame
-    input_df = readCsv(input_file)
-
-    # Add column names
-    input_df.columns = ["Title", "Path"]
+# Function to add rows to the end of the csv (the last row for a title is the current one until the csv is written again)
+def appendCsv(out_path: pathlib.Path, output_df: pandas.DataFrame) -> None:
+    try:
+        output_df.drop("Index", axis=1).to_csv(
+            out_path, mode="a", header=False, index=False, encoding="utf-8"
+        )
+    except:
+        logger.error(f'The file at "{out_path}" couldn\'t be written')
+        sys.exit()
 
-    # Creating an index column (for recombining at the end)
-    input_df["Index"] = input_df.index
 
-    # Creating empty columns for storing the path information
-    input_df["Score"] = pandas.NA
-    input_df["Engine"] = pandas.NA
-    input_df["Iteration"] = pandas.NA
+# Version of the manifest (a manifest from another version is treated as if there wasn't a last run)
+MANIFEST_VERSION = 2
+
+
+# Function to read the manifest from the last run (empty if there wasn't a last run)
+# The matches depend on the settings, so a manifest from other settings is treated as if there wasn't a last run too
+def readManifest(manifest_path: pathlib.Path, settings: dict) -> dict:
+    empty = {
+        "version": MANIFEST_VERSION,
+        "settings": settings,
+        "files": {},
+        "titles": {},
+    }
+    if not checkPath(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except:
+        logger.error(f'The manifest at "{manifest_path}" couldn\'t be read')
+        sys.exit()
+    if manifest.get("version") != MANIFEST_VERSION:
+        logger.warning(
+            f'The manifest at "{manifest_path}" is from an older version, every title and file is treated as new'
+        )
+        return empty
+    if manifest.get("settings") != settings:
+        logger.warning(
+            f'The manifest at "{manifest_path}" is from different settings, every title and file is treated as new'
+        )
+        return empty
+    return manifest
+
+
+# Function to get the settings the matches in the manifest depend on (stored as json, so only lists)
+def manifestSettings(user_args: UserPaths, normalizer: Normalizer) -> dict:
+    return {
+        "score_limit": user_args.score_limit,
+        "score_engine": user_args.score_engine,
+        "assignment": user_args.assignment,
+        "normalizer": normalizer.settings(),
+        "depth": user_args.depth,
+        "include": list(user_args.include),
+        "exclude": list(user_args.exclude),
+        "candidates": [user_args.candidates, user_args.ngram_size],
+    }
+
+
+# Function to write the manifest for the next run
+def writeManifest(
+    manifest_path: pathlib.Path,
+    input_df: pandas.DataFrame,
+    file_df: pandas.DataFrame,
+    file_path: pathlib.Path,
+    settings: dict,
+) -> None:
+    # Storing the matches for every title (None if it wasn't matched), a list for each title in the order of its rows
+    titles = {}
+    for title, path, score, engine, iteration in zip(
+        input_df["Title"],
+        input_df["Path"],
+        input_df["Score"],
+        input_df["Engine"],
+        input_df["Iteration"],
+    ):
+        if pandas.isna(path):
+            match = None
+        elif pandas.isna(score):
+            # The path was given in the input file (not matched)
+            match = [path, None, None, None]
+        else:
+            match = [path, int(score), int(engine), int(iteration)]
+        titles.setdefault(title, []).append(match)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "settings": settings,
+        "files": getFileStats(file_df, file_path),
+        "titles": titles,
+    }
+    try:
+        with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        logger.info(f'Wrote the manifest at "{manifest_path}"')
+    except:
+        logger.error(f'The manifest at "{manifest_path}" couldn\'t be written')
+        sys.exit()
+
+
+# Function to get the inode, size, and modified time of every file (to tell if they changed between runs)
+# The files are stored by their path from the files directory (None if the file couldn't be read, so it's always changed)
+def getFileStats(file_df: pandas.DataFrame, file_path: pathlib.Path) -> dict:
+    # Each directory is only made relative once
+    directories = {
+        x: os.path.relpath(x, file_path) for x in file_df["Directory"].cat.categories
+    }
+    stats = {}
+    for directory, base in zip(file_df["Directory"], file_df["Base"]):
+        try:
+            stat = os.stat(os.path.join(directory, base))
+            stat = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            stat = None
+        stats[os.path.normpath(os.path.join(directories[directory], base))] = stat
+    return stats
 
-    # Reading all the files in the file directory
-    file_df = getFiles(file_path)
+
+# Function to carry forward the matches from the last run and find which titles and files are new
+# The output only names the file, so the matches to a name are carried forward while every file with the name is unchanged
+def applyManifest(
+    manifest: dict,
+    input_df: pandas.DataFrame,
+    file_df: pandas.DataFrame,
+    file_path: pathlib.Path,
+) -> Tuple[pandas.Series, pandas.Series]:
+    old_files = manifest["files"]
+    old_titles = manifest["titles"]
+    # Files that are the same as the last run (counted by name, since more than one directory can have the name)
+    current_files = getFileStats(file_df, file_path)
+    same = [
+        stat is not None and old_files.get(path) == stat
+        for path, stat in current_files.items()
+    ]
+    unchanged = collections.Counter(file_df["Name"][same])
+    # Files that were given in the input file can't be carried forward to another title
+    given = set(input_df.loc[input_df["Path"].notna(), "Path"])
+    # The match from the last run of each row (the same title in the same order)
+    occurrence = input_df.groupby("Title", sort=False).cumcount()
+    old_matches = [
+        old_titles[title][count] if count < len(old_titles.get(title, [])) else False
+        for title, count in zip(input_df["Title"], occurrence)
+    ]
+    # The matches for each name from the last run (only carried forward if every file with the name is unchanged)
+    # Every file with a name is skipped once a title has it, so carrying only some of them would leave the rest unmatched
+    by_name = {}
+    for ind, old_match, path in zip(input_df.index, old_matches, input_df["Path"]):
+        # Only matches are carried forward (not given paths)
+        if not pandas.isna(path) or not old_match or old_match[1] is None:
+            continue
+        by_name.setdefault(old_match[0], []).append((ind, old_match))
+    totals = collections.Counter(file_df["Name"])
+    carried_ind, carried_matches = [], []
+    for name, matches in by_name.items():
+        if name in given or unchanged[name] < max(totals[name], len(matches)):
+            continue
+        for ind, old_match in matches:
+            carried_ind.append(ind)
+            carried_matches.append(old_match)
+    writeMatches(input_df, carried_ind, *zip(*carried_matches))
+    carried = len(carried_ind)
+    # Titles are new if they weren't in the last run (or their match couldn't be carried forward)
+    fresh_titles = pandas.Series(
+        [x is not None for x in old_matches],
+        index=input_df.index,
+    )
+    # Files are new if they changed or their name was matched last time (they were never compared to the unmatched titles)
+    matched_before = {
+        x[0] for matches in old_titles.values() for x in matches if x is not None
+    }
+    fresh_files = pandas.Series(
+        [not x or y in matched_before for x, y in zip(same, file_df["Name"])],
+        index=file_df.index,
+    )
+    claimed = given | {x[0] for x in carried_matches}
+    logger.info(
+        f"Manifest: {carried} matches carried forward, "
+        f"{int(fresh_titles[input_df['Path'].isna()].sum())} new titles, "
+        f"{int((fresh_files & ~file_df['Name'].isin(claimed)).sum())} new files"
+    )
+    return (fresh_titles, fresh_files)
+
+
+# Function to write matches into the input data frame (all at once instead of a cell at a time)
+def writeMatches(
+    input_df: pandas.DataFrame,
+    ind: Iterable,
+    paths: Iterable[str] = (),
+    scores: Iterable[int] = (),
+    engines: Iterable[int] = (),
+    iterations: Iterable[int] = (),
+) -> None:
+    ind = list(ind)
+    if len(ind) == 0:
+        return
+    values = numpy.empty((len(ind), 4), dtype=object)
+    for column, column_values in enumerate([paths, scores, engines, iterations]):
+        values[:, column] = list(column_values)
+    input_df.loc[ind, ["Path", "Score", "Engine", "Iteration"]] = values
+
+
+# Function to create the initial data frame
+def createInitialDataframes(
+    input_file: pathlib.Path,
+    file_path: pathlib.Path,
+    depth: int = 0,
+    include: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+    threads: int = 8,
+    listing: Optional[List[os.DirEntry]] = None,
+    items: Optional[Iterable[Tuple[str, bool]]] = None,
+) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    # Getting the input csv data in a data frame
+    input_df = prepareInputDataframe(readCsv(input_file))
+
+    # Reading all the files in the file directory (unless they were already read)
+    if items is None:
+        file_df = getFiles(file_path, depth, include, exclude, threads, listing)
+    else:
+        file_df = createFileDataframe(items)
 
     # # Removing files that are already in the found df (they've already been found :^])
     # file_df = file_df.drop(
@@ -253,6 +1963,44 @@ def createInitialDataframes(
     return (input_df, file_df)
 
 
+# Function to add the columns used for matching to the input data frame
+def prepareInputDataframe(input_df: pandas.DataFrame) -> pandas.DataFrame:
+    # Add column names
+    input_df.columns = ["Title", "Path"]
+
+    # Creating an index column (for recombining at the end)
+    input_df["Index"] = input_df.index
+
+    # Creating empty columns for storing the path information
+    input_df["Score"] = pandas.NA
+    input_df["Engine"] = pandas.NA
+    input_df["Iteration"] = pandas.NA
+    return input_df
+
+
+# Function to create the initial data frames from titles and files that are already in memory
+def createMemoryDataframes(
+    titles: Iterable[str],
+    files: Iterable[Union[str, pathlib.Path]],
+    directories: Iterable[Union[str, pathlib.Path]] = (),
+    paths: Optional[Iterable[Optional[str]]] = None,
+) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    titles = list(titles)
+    # Titles without a known path are the ones that will be searched for
+    if paths is None:
+        paths = [pandas.NA] * len(titles)
+    else:
+        paths = [pandas.NA if x is None else x for x in paths]
+    if len(paths) != len(titles):
+        raise ValueError("There must be one path (or None) for every title")
+    input_df = prepareInputDataframe(pandas.DataFrame({0: titles, 1: paths}))
+    # Build the file data frame the same way as reading the directory would
+    items = [(x, True) for x in files]
+    items.extend((x, False) for x in directories)
+    file_df = createFileDataframe(items)
+    return (input_df, file_df)
+
+
 # Function to create the desired data frames
 def createDesiredDataframes(
     input_df: pandas.DataFrame, file_df: pandas.DataFrame
@@ -280,172 +2028,987 @@ def createDesiredDataframes(
 
 
 # Function to get the file names
-def getFiles(file_path: pathlib.Path) -> pandas.DataFrame:
-    # Creating an empty list
-    temp_list = []
-    # Iterate through every item in the path
-    for item in file_path.iterdir():
-        # Add the file to a numpy array
-        if item.is_file():
-            temp_list.append([item, item.name, item.stem, True])
-        else:
-            temp_list.append([item, item.stem, item.stem, False])
-    # Create a data frame
-    temp_df = pandas.DataFrame(
-        data=temp_list, columns=["Path", "Name", "Title", "Type"]
+def getFiles(
+    file_path: pathlib.Path,
+    depth: int = 0,
+    include: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+    threads: int = 8,
+    listing: Optional[List[os.DirEntry]] = None,
+) -> pandas.DataFrame:
+    # The files are added to the data frame as each directory is scanned
+    return createFileDataframe(
+        scanFiles(file_path, depth, include, exclude, threads, listing)
+    )
+
+
+# Function to check if a name matches any of the glob patterns
+def matchesPattern(name: str, patterns: Iterable[str]) -> bool:
+    return any(fnmatch.fnmatchcase(name, x) for x in patterns)
+
+
+# Function to scan a single directory (returns the items in it and the subdirectories to scan next)
+# The directory is only listed if it wasn't already (the top directory is listed when checking the arguments)
+def scanDirectory(
+    directory: str,
+    depth: int,
+    include: List[str],
+    exclude: List[str],
+    listing: Optional[List[os.DirEntry]] = None,
+) -> Tuple[List[Tuple[str, bool]], List[Tuple[str, int]]]:
+    items = []
+    subdirectories = []
+    if listing is None:
+        with os.scandir(directory) as entries:
+            listing = list(entries)
+    for entry in listing:
+        # Excluded directories aren't searched either
+        if matchesPattern(entry.name, exclude):
+            continue
+        # Check if it's a file or directory (uses the type from the directory listing unless it's a link)
+        is_file = entry.is_file()
+        if len(include) == 0 or matchesPattern(entry.name, include):
+            items.append((entry.path, is_file))
+        # Search the subdirectories if there are levels left (-1 is every level), but don't follow links
+        if depth != 0 and entry.is_dir(follow_symlinks=False):
+            subdirectories.append((entry.path, depth - 1))
+    return (items, subdirectories)
+
+
+# Function to scan the directory and its subdirectories on a thread pool (the items are returned as they're found)
+def scanFiles(
+    file_path: pathlib.Path,
+    depth: int = 0,
+    include: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+    threads: int = 8,
+    listing: Optional[List[os.DirEntry]] = None,
+) -> Iterator[Tuple[str, bool]]:
+    include, exclude = list(include), list(exclude)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        # The directories are returned in the order they were found (so the order is always the same) while the rest are scanned
+        pending = collections.deque(
+            [
+                executor.submit(
+                    scanDirectory, str(file_path), depth, include, exclude, listing
+                )
+            ]
+        )
+        while len(pending) != 0:
+            # A directory that can't be read (no permission, or removed while scanning) is skipped
+            try:
+                items, subdirectories = pending.popleft().result()
+            except OSError as error:
+                logger.warning(
+                    f'The directory at "{error.filename}" couldn\'t be read and was skipped ({error.strerror})'
+                )
+                continue
+            for subdirectory, sub_depth in subdirectories:
+                pending.append(
+                    executor.submit(
+                        scanDirectory, subdirectory, sub_depth, include, exclude
+                    )
+                )
+            yield from items
+
+
+# Function to get the stem of a name (the same as pathlib, the last extension is taken off unless the name starts or ends with the dot)
+def nameStem(name: str) -> str:
+    dot = name.rfind(".")
+    if 0 < dot < len(name) - 1:
+        return name[:dot]
+    return name
+
+
+# Function to get the name of a file or directory (files are named with their extension and directories are named by their stem)
+def entryName(path: Union[str, pathlib.Path], is_file: bool) -> str:
+    base = os.path.basename(path)
+    return base if is_file else nameStem(base)
+
+
+# Function to create the file data frame from paths and whether they are files
+# Each directory is stored once (the entries have a code into the directory table), and the names of files are the same strings as their base names
+def createFileDataframe(
+    items: Iterable[Tuple[Union[str, pathlib.Path], bool]],
+) -> pandas.DataFrame:
+    lookup = {}
+    codes, bases, titles, names, types = [], [], [], [], []
+    for path, is_file in items:
+        directory, base = os.path.split(path)
+        codes.append(lookup.setdefault(directory, len(lookup)))
+        bases.append(base)
+        title = nameStem(base)
+        titles.append(title)
+        names.append(base if is_file else title)
+        types.append(is_file)
+    # Create a data frame from the columns
+    return pandas.DataFrame(
+        {
+            "Directory": pandas.Categorical.from_codes(
+                numpy.array(codes, dtype=numpy.int32), list(lookup)
+            ),
+            "Base": bases,
+            "Name": names,
+            "Title": titles,
+            "Type": numpy.array(types, dtype=bool),
+        },
+        columns=["Directory", "Base", "Name", "Title", "Type"],
     )
-    return temp_df
 
 
-# Function to find the best match
-def findMatch(
-    title: str, search_titles: List[str], matching: numpy.ndarray, token_engine: int
-) -> list:
-    # Use the desired engine
+# Scorers for each of the engines (the numbers match the cli score engine options)
+# These are the rapidfuzz scorers that thefuzz uses behind the scenes, run on the strings from processStrings
+# The token sort engines are the same as comparing the tokens after they're sorted ahead of time
+SCORE_ENGINES = {
+    0: rapidfuzz.fuzz.ratio,  # Simple checking based on the entire strings
+    1: rapidfuzz.fuzz.partial_ratio,  # Simple checking, but it checks substrings instead of the entire string
+    2: rapidfuzz.fuzz.ratio,  # Tokenizes (splits up) the strings before comparing them. Sorts them as well so the order of words doesn't matter.
+    3: rapidfuzz.fuzz.partial_ratio,  # Same as token sort ratio, but does it with substrings
+    4: rapidfuzz.fuzz.token_set_ratio,  # Tokenizes (splits up) the strings before comparing them. Sorts them as well so the order of words doesn't matter. It also takes out common tokens/words.
+    5: rapidfuzz.fuzz.partial_token_set_ratio,  # Same as token set ratio, but does it with substrings
+}
+# For matching files you probably want it to be as similar as possible (i.e. the smaller integer options)
+
+# Which processed form of the strings each engine compares
+ENGINE_FORMS = {0: "plain", 1: "plain", 2: "sorted", 3: "sorted", 4: "set", 5: "set"}
+
+# Maximum number of title x file scores to hold in memory at once (scored in chunks of titles)
+SCORE_CHUNK_CELLS = 2**24
+
+
+# Function to normalize the strings (only made lower case without a normalizer)
+def normalizeStrings(strings: List[str], normalizer: Optional[Normalizer]) -> List[str]:
+    if normalizer is None:
+        return [x.lower() for x in strings]
+    return [normalizer.normalize(x) for x in strings]
+
+
+# Function to process the strings the same way thefuzz.process.extract does before scoring (the token engines get their tokens sorted ahead of time)
+def processStrings(strings: List[str], form: str, query: bool) -> List[str]:
+    # The query is processed once by thefuzz and then again like the choices by rapidfuzz
+    if query:
+        strings = [thefuzz.utils.full_process(x) for x in strings]
+    # The strings are forced to ascii for the token engines (thefuzz does this in _get_processor)
+    force_ascii = form != "plain"
+    processed = [
+        thefuzz.utils.full_process(x, force_ascii=force_ascii) for x in strings
+    ]
+    # Sorted tokens for the token sort engines and sorted unique tokens for the token set engines
+    if form == "sorted":
+        processed = [" ".join(sorted(x.split())) for x in processed]
+    elif form == "set":
+        processed = [" ".join(sorted(set(x.split()))) for x in processed]
+    return processed
+
+
+# Function to get the indices of the best scores in every row (ordered by score, ties by the lowest index like thefuzz)
+def topIndices(scores: numpy.ndarray, limit: int) -> numpy.ndarray:
+    rows, columns = scores.shape
+    limit = min(limit, columns)
+    if limit == 0:
+        return numpy.empty((rows, 0), dtype=numpy.intp)
+    # If there's only a few columns just sort all of them
+    if columns <= limit:
+        return numpy.argsort(-scores, axis=1, kind="stable")[:, :limit]
+    # Get the best values (in any order) without sorting the entire row
+    best = numpy.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+    best_scores = numpy.take_along_axis(scores, best, axis=1)
+    # Sort the best values by score and then index
+    order = numpy.lexsort((best, -best_scores), axis=1)
+    best = numpy.take_along_axis(best, order, axis=1)
+    # The rows with ties on the lowest score may have picked the wrong (higher) index, so redo those
+    lowest = numpy.take_along_axis(scores, best[:, -1:], axis=1)
+    tied = numpy.flatnonzero((scores >= lowest).sum(axis=1) > limit)
+    for row in tied:
+        candidates = numpy.flatnonzero(scores[row] >= lowest[row, 0])
+        candidates = candidates[numpy.lexsort((candidates, -scores[row, candidates]))]
+        best[row] = candidates[:limit]
+    return best
+
+
+# Function to get the position of every value in its group (the values must be sorted)
+def groupRanks(groups: numpy.ndarray) -> numpy.ndarray:
+    if len(groups) == 0:
+        return numpy.zeros(0, dtype=numpy.intp)
+    starts = numpy.flatnonzero(numpy.r_[True, groups[1:] != groups[:-1]])
+    return numpy.arange(len(groups)) - numpy.repeat(
+        starts, numpy.diff(numpy.r_[starts, len(groups)])
+    )
+
+
+# Function to get the best results for every row from (row, column, score) results (ordered by score, ties by the lowest column)
+def sparseTopIndices(
+    rows: numpy.ndarray,
+    columns: numpy.ndarray,
+    scores: numpy.ndarray,
+    row_count: int,
+    limit: int,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    # Empty results are -1
+    best_columns = numpy.full((row_count, limit), -1, dtype=numpy.intp)
+    best_scores = numpy.zeros((row_count, limit), dtype=scores.dtype)
+    # Group the results by row, highest score first
+    order = numpy.lexsort((columns, -scores, rows))
+    rows = rows[order]
+    rank = groupRanks(rows)
+    # Keep only the best results for each row
+    keep = rank < limit
+    best_columns[rows[keep], rank[keep]] = columns[order][keep]
+    best_scores[rows[keep], rank[keep]] = scores[order][keep]
+    return (best_columns, best_scores)
+
+
+# Function to get the lengths the length bounded engines compare (None if the engine can't be bounded by length)
+def boundedLengths(strings: List[str], token_engine: int) -> Optional[numpy.ndarray]:
+    # Ratio compares the entire strings
     if token_engine == 0:
-        result = thefuzz.process.extract(
-            title, search_titles, scorer=thefuzz.fuzz.ratio, limit=3
+        return numpy.array([len(x) for x in strings], dtype=numpy.int64)
+    # Token sort ratio compares the sorted tokens joined by single spaces
+    elif token_engine == 2:
+        return numpy.array(
+            [len(" ".join(x.split())) for x in strings], dtype=numpy.int64
+        )
+    # The partial engines can match a short string inside a long one, and token set ratio is 100 for any subset of tokens
+    return None
+
+
+# Function to split the titles into groups that only need to be compared to files within a range of lengths
+def pruneGroups(
+    queries: List[str], choices: List[str], token_engine: int, score_limit: int
+) -> List[Tuple[numpy.ndarray, numpy.ndarray]]:
+    all_groups = [(numpy.arange(len(queries)), numpy.arange(len(choices)))]
+    # The lowest unrounded score that can round up to the score limit
+    cutoff = score_limit - 0.5
+    query_lengths = boundedLengths(queries, token_engine)
+    if query_lengths is None or cutoff <= 0:
+        return all_groups
+    choice_lengths = boundedLengths(choices, token_engine)
+    choice_order = numpy.argsort(choice_lengths, kind="stable")
+    sorted_lengths = choice_lengths[choice_order]
+    groups = []
+    for length in numpy.unique(query_lengths).tolist():
+        # The best possible ratio is 200 * shorter / (shorter + longer), so this is the range of lengths that can reach the cutoff
+        if length == 0:
+            low, high = 0, 0
+        else:
+            low = math.ceil(cutoff * length / (200 - cutoff) - 1e-9)
+            high = math.floor(length * (200 - cutoff) / cutoff + 1e-9)
+        start = numpy.searchsorted(sorted_lengths, low, side="left")
+        stop = numpy.searchsorted(sorted_lengths, high, side="right")
+        # Keeping the files in their original order (so ties are still broken by the lowest index)
+        columns = numpy.sort(choice_order[start:stop])
+        groups.append((numpy.flatnonzero(query_lengths == length), columns))
+    return groups
+
+
+# Function to put strings into shared memory (a count, the offset of every string, and then the utf-8 bytes)
+def shareStrings(strings: List[str]) -> shared_memory.SharedMemory:
+    encoded = [x.encode("utf-8") for x in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(x) for x in encoded], out=offsets[1:])
+    header = 8 * (len(offsets) + 1)
+    memory = shared_memory.SharedMemory(
+        create=True, size=max(1, header + int(offsets[-1]))
+    )
+    memory.buf[:8] = numpy.array([len(encoded)], dtype=numpy.int64).tobytes()
+    memory.buf[8:header] = offsets.tobytes()
+    memory.buf[header : header + int(offsets[-1])] = b"".join(encoded)
+    return memory
+
+
+# Function to read strings from shared memory (written by shareStrings)
+def readSharedStrings(name: str) -> List[str]:
+    memory = shared_memory.SharedMemory(name=name)
+    count = int.from_bytes(memory.buf[:8], sys.byteorder, signed=True)
+    header = 8 * (count + 2)
+    offsets = numpy.frombuffer(bytes(memory.buf[8:header]), dtype=numpy.int64)
+    data = bytes(memory.buf[header : header + int(offsets[-1])])
+    memory.close()
+    return [
+        data[start:stop].decode("utf-8")
+        for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+    ]
+
+
+# The file titles each worker process last read from shared memory (every shard of a call uses the same file titles)
+worker_strings = {}
+
+
+# Function to score a shard of titles in a worker process
+def scoreShard(
+    name: str,
+    queries: List[str],
+    token_engine: int,
+    score_limit: int,
+    keep: Optional[int],
+    keep_columns: Optional[int],
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]:
+    if name not in worker_strings:
+        worker_strings.clear()
+        worker_strings[name] = readSharedStrings(name)
+    # Each process only uses one thread (the processes already use every core)
+    return findPairs(
+        queries,
+        worker_strings[name],
+        token_engine,
+        score_limit,
+        keep,
+        keep_columns,
+        workers=1,
+    )
+
+
+# Function to find the pairs of titles and files with a score of at least the score limit (only the best few for each title if keep is given)
+# The strings should already be processed, and the scores aren't rounded yet (thefuzz orders the results before rounding)
+def findPairs(
+    queries: List[str],
+    choices: List[str],
+    token_engine: int,
+    score_limit: int,
+    keep: Optional[int] = None,
+    keep_columns: Optional[int] = None,
+    score_pool: Optional[ScorePool] = None,
+    workers: int = -1,
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]:
+    # Scoring each different string once (repeated titles and files get the pairs of their string)
+    # The unique strings are numbered by their first position, so the kept results (ties by the lowest index) still hold every title's and file's best pairs
+    query_keys, query_groups = uniqueStrings(queries)
+    choice_keys, choice_groups = uniqueStrings(choices)
+    if len(query_keys) < len(queries) or len(choice_keys) < len(choices):
+        row, column, score, compared = findPairs(
+            query_keys,
+            choice_keys,
+            token_engine,
+            score_limit,
+            keep,
+            keep_columns,
+            score_pool,
+            workers,
         )
-        # Simple checking based on the entire strings
-    elif token_engine == 1:
-        result = thefuzz.process.extract(
-            title, search_titles, scorer=thefuzz.fuzz.partial_ratio, limit=3
+        pair_index, rows = expandGroups(row, query_groups, len(query_keys))
+        column, score = column[pair_index], score[pair_index]
+        pair_index, columns = expandGroups(column, choice_groups, len(choice_keys))
+        return (rows[pair_index], columns, score[pair_index], compared)
+    # Splitting the titles across the worker processes (if there are any)
+    if score_pool is not None and len(queries) > 1 and len(choices) > 0:
+        return score_pool.findPairs(
+            queries, choices, token_engine, score_limit, keep, keep_columns
         )
-        # Simple checking, but it checks substrings instead of the entire string
-    elif token_engine == 2:
-        result = thefuzz.process.extract(
-            title, search_titles, scorer=thefuzz.fuzz.token_sort_ratio, limit=3
+    rows, columns, scores = [], [], []
+    # Counting the comparisons that were actually made
+    compared = 0
+    for group_rows, group_columns in pruneGroups(
+        queries, choices, token_engine, score_limit
+    ):
+        if len(group_rows) == 0 or len(group_columns) == 0:
+            continue
+        group_choices = [choices[x] for x in group_columns]
+        chunk_size = max(1, SCORE_CHUNK_CELLS // len(group_choices))
+        for start in range(0, len(group_rows), chunk_size):
+            chunk_rows = group_rows[start : start + chunk_size]
+            compared += len(chunk_rows) * len(group_choices)
+            # Scores that would round below the score limit are skipped by the scorer
+            matrix = rapidfuzz.process.cdist(
+                [queries[x] for x in chunk_rows],
+                group_choices,
+                scorer=SCORE_ENGINES[token_engine],
+                score_cutoff=max(0, score_limit - 0.5),
+                dtype=numpy.float64,
+                workers=workers,
+            )
+            if keep is None:
+                row, column = numpy.nonzero(numpy.round(matrix) >= score_limit)
+            else:
+                # Only keeping the best results for each title (ordered by score, ties by the lowest index)
+                best = topIndices(matrix, keep)
+                row = numpy.repeat(numpy.arange(len(chunk_rows)), best.shape[1])
+                column = best.ravel()
+                if keep_columns is not None:
+                    # Also keeping the best results for each file (rounded scores, ties by the lowest title index like the file results)
+                    best = topIndices(numpy.round(matrix).T, keep_columns)
+                    row = numpy.r_[row, best.ravel()]
+                    column = numpy.r_[
+                        column,
+                        numpy.repeat(numpy.arange(len(group_choices)), best.shape[1]),
+                    ]
+                    # Pairs that are the best for both the title and the file are only kept once
+                    row, column = numpy.divmod(
+                        numpy.unique(row * len(group_choices) + column),
+                        len(group_choices),
+                    )
+                found = numpy.round(matrix[row, column]) >= score_limit
+                row, column = row[found], column[found]
+            rows.append(chunk_rows[row])
+            columns.append(group_columns[column])
+            scores.append(matrix[row, column])
+    if len(rows) == 0:
+        return (
+            numpy.zeros(0, dtype=numpy.intp),
+            numpy.zeros(0, dtype=numpy.intp),
+            numpy.zeros(0, dtype=numpy.float64),
+            compared,
         )
-        # Tokenizes (splits up) the strings before comparing them. Sorts them as well so the order of words doesn't matter.
-    elif token_engine == 3:
-        result = thefuzz.process.extract(
-            title, search_titles, scorer=thefuzz.fuzz.partial_token_sort_ratio, limit=3
+    return (
+        numpy.concatenate(rows),
+        numpy.concatenate(columns),
+        numpy.concatenate(scores),
+        compared,
+    )
+
+
+# Function to get the position of each string's first appearance (and which unique string each string is)
+def uniqueStrings(strings: List[str]) -> Tuple[List[str], numpy.ndarray]:
+    lookup = {}
+    groups = numpy.array(
+        [lookup.setdefault(x, len(lookup)) for x in strings], dtype=numpy.intp
+    )
+    return (list(lookup), groups)
+
+
+# Function to expand results for unique strings to every position that has that string
+def expandGroups(
+    pair_keys: numpy.ndarray, groups: numpy.ndarray, key_count: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    order = numpy.argsort(groups, kind="stable")
+    counts = numpy.bincount(groups, minlength=key_count)
+    starts = numpy.cumsum(counts) - counts
+    # Repeat each pair once for every position with its string
+    repeat = counts[pair_keys]
+    pair_index = numpy.repeat(numpy.arange(len(pair_keys)), repeat)
+    offset = numpy.arange(len(pair_index)) - numpy.repeat(
+        numpy.cumsum(repeat) - repeat, repeat
+    )
+    positions = order[starts[pair_keys][pair_index] + offset]
+    return (pair_index, positions)
+
+
+# Function to find the pairs of titles and files above the score limit, only scoring pairs that aren't in the cache
+def findCachedPairs(
+    queries: List[str],
+    choices: List[str],
+    token_engine: int,
+    score_limit: int,
+    score_cache: ScoreCache,
+    score_pool: Optional[ScorePool] = None,
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]:
+    # The processed strings are used as the cache keys (and identical strings are only scored once)
+    title_keys, title_groups = uniqueStrings(queries)
+    file_keys, file_groups = uniqueStrings(choices)
+    # Getting the scores that are already known
+    known_titles, known_files, known = score_cache.lookup(
+        token_engine, score_limit, title_keys, file_keys
+    )
+    # Scoring the new titles against every file and the known titles against the new files
+    new_titles = numpy.flatnonzero(~known_titles)
+    old_titles = numpy.flatnonzero(known_titles)
+    new_files = numpy.flatnonzero(~known_files)
+    rows, columns, scores = [], [], []
+    compared = 0
+    for title_ids, file_ids in [
+        (new_titles, numpy.arange(len(file_keys))),
+        (old_titles, new_files),
+    ]:
+        row, column, score, count = findPairs(
+            [title_keys[x] for x in title_ids],
+            [file_keys[x] for x in file_ids],
+            token_engine,
+            score_limit,
+            score_pool=score_pool,
         )
-        # Same as token sort ratio, but does it with substrings
-    elif token_engine == 4:
-        result = thefuzz.process.extract(
-            title, search_titles, scorer=thefuzz.fuzz.token_set_ratio, limit=3
+        compared += count
+        rows.append(title_ids[row])
+        columns.append(file_ids[column])
+        scores.append(score)
+    rows, columns, scores = (
+        numpy.concatenate(rows),
+        numpy.concatenate(columns),
+        numpy.concatenate(scores),
+    )
+    # Storing the new scores
+    score_cache.store(
+        token_engine,
+        score_limit,
+        title_keys,
+        file_keys,
+        [
+            (title_keys[row], file_keys[column], score)
+            for row, column, score in zip(
+                rows.tolist(), columns.tolist(), scores.tolist()
+            )
+        ],
+    )
+    hits = len(old_titles) * (len(file_keys) - len(new_files))
+    misses = len(title_keys) * len(file_keys) - hits
+    logger.info(
+        f"Cache engine {token_engine}: {hits} hits, {misses} misses ({misses - compared} pruned)"
+    )
+    # Adding the known scores
+    if len(known) != 0:
+        known_rows, known_columns, known_scores = zip(*known)
+        rows = numpy.r_[rows, numpy.array(known_rows, dtype=numpy.intp)]
+        columns = numpy.r_[columns, numpy.array(known_columns, dtype=numpy.intp)]
+        scores = numpy.r_[scores, numpy.array(known_scores, dtype=numpy.float64)]
+    # Expanding the unique strings back out to every title and file
+    pair_index, title_positions = expandGroups(rows, title_groups, len(title_keys))
+    columns, scores = columns[pair_index], scores[pair_index]
+    pair_index, file_positions = expandGroups(columns, file_groups, len(file_keys))
+    return (title_positions[pair_index], file_positions, scores[pair_index], compared)
+
+
+# Function to create the tables
+def createTables(
+    titles: pandas.DataFrame,
+    search: pandas.DataFrame,
+    fresh_files: Optional[pandas.Series] = None,
+    fresh_titles: Optional[pandas.Series] = None,
+    normalizer: Optional[Normalizer] = None,
+) -> Tuple[FileTable, TitleTable]:
+    # Create a table to store the file results
+    file_table = FileTable(titles, fresh_files, normalizer)
+    # Create a table to store the title results
+    title_table = TitleTable(search, fresh_titles, normalizer)
+    return (file_table, title_table)
+
+
+# Function to get which titles need to be compared to which files (as positions in the remaining titles and files)
+def freshSplits(
+    file_table: FileTable,
+    title_table: TitleTable,
+    title_ids: numpy.ndarray,
+    file_ids: numpy.ndarray,
+) -> List[Tuple[numpy.ndarray, numpy.ndarray]]:
+    # Titles from the last run only need to be compared to the new files (every title is new without a manifest)
+    fresh_titles = title_table.fresh[title_ids]
+    new_files = numpy.flatnonzero(file_table.fresh[file_ids])
+    return [
+        (numpy.flatnonzero(fresh_titles), numpy.arange(len(file_ids))),
+        (numpy.flatnonzero(~fresh_titles), new_files),
+    ]
+
+
+# Function to score the titles and files with every engine at once (so the stages don't have to score them again)
+def scoreAllEngines(
+    file_table: FileTable,
+    title_table: TitleTable,
+    score_limit: int,
+    score_pool: Optional[ScorePool] = None,
+    engines: Iterable[int] = range(0, 6),
+    title_ids: Optional[numpy.ndarray] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+    file_ids = file_table.remaining()
+    # Only scoring some of the titles if they're given (for shards)
+    if title_ids is None:
+        title_ids = title_table.remaining()
+    splits = freshSplits(file_table, title_table, title_ids, file_ids)
+    stage_scores = {}
+    for token_engine in engines:
+        # The strings are only processed once for each form (engines with the same form share them)
+        queries = title_table.processed(token_engine)
+        choices = file_table.processed(token_engine)
+        queries = [queries[x] for x in title_ids]
+        choices = [choices[x] for x in file_ids]
+        pair_titles, pair_files, pair_scores = [], [], []
+        compared = 0
+        for title_rows, file_columns in splits:
+            # Keeping every pair above the score limit (files can be removed by the earlier stages)
+            row, column, score, count = findPairs(
+                [queries[x] for x in title_rows],
+                [choices[x] for x in file_columns],
+                token_engine,
+                score_limit,
+                score_pool=score_pool,
+            )
+            pair_titles.append(title_ids[title_rows[row]])
+            pair_files.append(file_ids[file_columns[column]])
+            pair_scores.append(score)
+            compared += count
+        stage_scores[token_engine] = (
+            numpy.concatenate(pair_titles),
+            numpy.concatenate(pair_files),
+            numpy.concatenate(pair_scores),
         )
-        # Tokenizes (splits up) the strings before comparing them. Sorts them as well so the order of words doesn't matter. It also takes out common tokens/words.
-    elif token_engine == 5:
-        result = thefuzz.process.extract(
-            title, search_titles, scorer=thefuzz.fuzz.partial_token_set_ratio, limit=3
+        logger.info(
+            f"Single pass engine {token_engine}: {compared} comparisons made, {len(stage_scores[token_engine][0])} pairs kept"
         )
-        # Same as token set ratio, but does it with substrings
-    # For matching files you probably want it to be as similar as possible (i.e. the smaller integer options)
-    # Modifying the results to use the original path instead of lower case
-    new_result = [list(x) for x in result]
-    for x in range(0, len(new_result)):
-        ibx = numpy.where(matching[1] == new_result[x][0])
-        new_result[x][0] = matching[0][ibx].item()
+        if metrics is not None:
+            metrics.count("comparisons", compared, engine=token_engine)
+    return stage_scores
 
-    return new_result
 
+# Function to get the pairs of remaining titles and files above the score limit (as positions in the remaining titles and files)
+# Every pair is returned unless keep and keep_columns are given (then at least each title's and file's best pairs are)
+def findStagePairs(
+    file_table: FileTable,
+    title_table: TitleTable,
+    token_engine: int,
+    score_limit: int = 0,
+    score_cache: Optional[ScoreCache] = None,
+    stage_scores: Optional[
+        Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    ] = None,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+    keep: Optional[int] = None,
+    keep_columns: Optional[int] = None,
+    retriever: Optional[NgramRetriever] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    # Only compare the files and titles that haven't been matched yet
+    file_ids = file_table.remaining()
+    title_ids = title_table.remaining()
 
-# Function to create the classes
-def createClasses(titles: pandas.DataFrame, search: pandas.DataFrame):
-    # Create a series of classes to store the file results
-    file_classes = createFileClasses(titles)
-    # Create a series of classes to store the title results
-    title_classes = createTitleClasses(search)
-    return (file_classes, title_classes)
+    if stage_scores is not None:
+        # Using the scores from the single pass (only the pairs of titles and files that are left)
+        pair_titles, pair_files, pair_scores = stage_scores[token_engine]
+        left = ~title_table.used[pair_titles] & ~file_table.used[pair_files]
+        # Converting the ids into positions in the remaining titles and files
+        rows = numpy.searchsorted(title_ids, pair_titles[left])
+        columns = numpy.searchsorted(file_ids, pair_files[left])
+        pair_scores = pair_scores[left]
+    elif retriever is not None:
+        # Only scoring the candidates of the titles that are left (the files with the most similar n-grams)
+        pair_titles, pair_files = retriever.findCandidates(title_table, file_table)
+        left = ~title_table.used[pair_titles] & ~file_table.used[pair_files]
+        # Titles from the last run only need to be compared to the new files (like freshSplits)
+        left &= title_table.fresh[pair_titles] | file_table.fresh[pair_files]
+        pair_titles, pair_files = pair_titles[left], pair_files[left]
+        queries = title_table.processed(token_engine)
+        choices = file_table.processed(token_engine)
+        pair_scores = numpy.zeros(len(pair_titles), dtype=numpy.float64)
+        if len(pair_titles) != 0:
+            pair_scores = rapidfuzz.process.cpdist(
+                [queries[x] for x in pair_titles.tolist()],
+                [choices[x] for x in pair_files.tolist()],
+                scorer=SCORE_ENGINES[token_engine],
+                dtype=numpy.float64,
+                workers=-1,
+            )
+        logger.info(
+            f"Engine {token_engine}: {len(pair_titles)} of {len(title_ids) * len(file_ids)} comparisons made (the rest weren't candidates)"
+        )
+        if metrics is not None:
+            metrics.count("comparisons", len(pair_titles), engine=token_engine)
+        # Converting the pairs above the score limit into positions in the remaining titles and files
+        found = numpy.round(pair_scores) >= score_limit
+        rows = numpy.searchsorted(title_ids, pair_titles[found])
+        columns = numpy.searchsorted(file_ids, pair_files[found])
+        pair_scores = pair_scores[found]
+    elif score_cache is None:
+        # Getting the processed strings (only processed once, the first time they're used)
+        queries = title_table.processed(token_engine)
+        choices = file_table.processed(token_engine)
+        queries = [queries[x] for x in title_ids]
+        choices = [choices[x] for x in file_ids]
+        rows = [numpy.zeros(0, dtype=numpy.intp)]
+        columns = [numpy.zeros(0, dtype=numpy.intp)]
+        pair_scores = [numpy.zeros(0, dtype=numpy.float64)]
+        compared, total = 0, 0
+        # Continuing from the pairs in the checkpoint (if this stage is being resumed)
+        resume_position = (0, 0)
+        progress = None if checkpoint is None else checkpoint.takeProgress(token_engine)
+        if progress is not None:
+            resume_position = progress[0]
+            for part, values in zip([rows, columns, pair_scores], progress[1]):
+                part.append(values)
+        for split, (title_rows, file_columns) in enumerate(
+            freshSplits(file_table, title_table, title_ids, file_ids)
+        ):
+            total += len(title_rows) * len(file_columns)
+            # The titles are scored in blocks when checkpointing (so the pairs so far can be saved every interval)
+            block_size = len(title_rows)
+            if checkpoint is not None:
+                block_size = checkpoint.blockSize(len(file_columns))
+            for start in range(0, len(title_rows), max(1, block_size)):
+                if (split, start) < resume_position:
+                    continue
+                block_rows = title_rows[start : start + block_size]
+                # Getting the pairs above the score limit (positions, not names)
+                row, column, score, count = findPairs(
+                    [queries[x] for x in block_rows],
+                    [choices[x] for x in file_columns],
+                    token_engine,
+                    score_limit,
+                    keep,
+                    keep_columns,
+                    score_pool,
+                )
+                rows.append(block_rows[row])
+                columns.append(file_columns[column])
+                pair_scores.append(score)
+                compared += count
+                if checkpoint is not None and checkpoint.due():
+                    checkpoint.save(
+                        file_table,
+                        title_table,
+                        token_engine,
+                        (split, start + block_size),
+                        (
+                            numpy.concatenate(rows),
+                            numpy.concatenate(columns),
+                            numpy.concatenate(pair_scores),
+                        ),
+                    )
+        rows, columns, pair_scores = (
+            numpy.concatenate(rows),
+            numpy.concatenate(columns),
+            numpy.concatenate(pair_scores),
+        )
+        logger.info(
+            f"Engine {token_engine}: {compared} of {total} comparisons made ({total - compared} pruned)"
+        )
+        if metrics is not None:
+            metrics.count("comparisons", compared, engine=token_engine)
+    else:
+        # The cache already skips the pairs that were scored before (so every pair is checked through it)
+        # Only the pairs above the score limit are kept in the cache (the lower results can never match anyways)
+        queries = title_table.processed(token_engine)
+        choices = file_table.processed(token_engine)
+        rows, columns, pair_scores, compared = findCachedPairs(
+            [queries[x] for x in title_ids],
+            [choices[x] for x in file_ids],
+            token_engine,
+            score_limit,
+            score_cache,
+            score_pool,
+        )
+        if metrics is not None:
+            metrics.count("comparisons", compared, engine=token_engine)
+    return (title_ids, file_ids, rows, columns, pair_scores)
 
 
 # Function to get string similarity
 def findSimilarity(
-    file_classes: pandas.Series,
-    title_classes: pandas.Series,
-    search_df: pandas.DataFrame,
+    file_table: FileTable,
+    title_table: TitleTable,
     token_engine: int,
+    score_limit: int = 0,
+    score_cache: Optional[ScoreCache] = None,
+    stage_scores: Optional[
+        Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    ] = None,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+    retriever: Optional[NgramRetriever] = None,
+    score_map: Optional[ScoreMap] = None,
+    checkpoint: Optional[Checkpoint] = None,
 ) -> None:
-    # Create a list of the plain titles
-    titles = [x.title for x in file_classes]
-    # Create a list of files in lower case to compare to (I believe making it lower case will make them closer)
-    file_titles = [x.lower() for x in titles]
-    # Create a numpy array with both
-    file_np = numpy.array([titles, file_titles])
-
-    # Checking each file in the search df to find the best match in the file titles df
-    for index, row in search_df.iterrows():
-        # Getting the fuzz results comparing the searching title to the files
-        result = findMatch(row["Title"].lower(), file_titles, file_np, token_engine)
-        # Updating the results for the titles
-        title_class: TitleFuzzResult = title_classes[pathHash(row["Title"])]
-
-        # Implementing handling for results for the title class if less than 3
-        if len(result) == 3:
-            # This will update the class in the series because it's just a reference not a copy
-            title_class.updateResults(result[0], result[1], result[2])
-        elif len(result) == 2:
-            title_class.updateResults(result[0], result[1], None)
-        else:
-            title_class.updateResults(result[0], None, None)
-
-        # Implementing handling for results for the files class if less than 3
-        if len(result) >= 1:
-            # Updating the result for the files
-            result1_class: FileFuzzResult = file_classes[pathHash(result[0][0])]
-            result1_class.updateResults([row["Title"], result[0][1]])
-        if len(result) >= 2:
-            result2_class: FileFuzzResult = file_classes[pathHash(result[1][0])]
-            result2_class.updateResults([row["Title"], result[1][1]])
-        if len(result) == 3:
-            result3_class: FileFuzzResult = file_classes[pathHash(result[2][0])]
-            result3_class.updateResults([row["Title"], result[2][1]])
-
-
-# Function to create a dictionary to store file fuzz results
-def createFileClasses(df: pandas.DataFrame) -> pandas.Series:
-    temp_list = []
-    for ind, row in df.iterrows():
-        temp_list.append(
-            FileFuzzResult(row["Path"], row["Name"], row["Title"], row["Type"], ind)
-        )
-    # Create hash to store the titles because they can be key breaking (I don't think they actually are, but I already implemented before I realized the true error)
-    index_hash = [pathHash(x) for x in list(df["Title"])]
-    temp_series = pandas.Series(data=temp_list, index=index_hash)
-    return temp_series
-
-
-# Function to create a dictionary to store title fuzz results
-def createTitleClasses(df: pandas.DataFrame) -> pandas.Series:
-    temp_list = []
-    for ind, row in df.iterrows():
-        temp_list.append(TitleFuzzResult(row["Title"], ind))
-    # Create hash to store the titles because they can be key breaking (I don't think they actually are, but I already implemented before I realized the true error)
-    index_hash = [pathHash(x) for x in list(df["Title"])]
-    temp_series = pandas.Series(data=temp_list, index=index_hash)
-    return temp_series
-
-
-# Function to create a hash for the path strings
-def pathHash(pre: str) -> str:
-    return hashlib.sha256(
-        pre.encode("utf-8-sig")
-    ).hexdigest()  # might need to try utf-8-sig if this doesn't work
-
-
-# Function to get the title results for a certain type
-def getCheckValue(title_value: str, search: int) -> List[Union[str, int]]:
-    # Would like to use a case statement instead of if, but I need it to work on older python
-    if search == 0:
-        return title_value.first_result
-    elif search == 1:
-        return title_value.second_result
-    elif search == 2:
-        return title_value.third_result
+    # Scoring every pair into the map on disk and reading the results back from it (if the user is using one)
+    if score_map is not None:
+        title_ids = title_table.remaining()
+        file_ids = file_table.remaining()
+        queries = title_table.processed(token_engine)
+        choices = file_table.processed(token_engine)
+        indices, scores, file_results, file_scores = score_map.findResults(
+            [queries[x] for x in title_ids],
+            [choices[x] for x in file_ids],
+            token_engine,
+            score_limit,
+        )
+        logger.info(
+            f"Engine {token_engine}: {len(title_ids) * len(file_ids)} comparisons made (mapped on disk)"
+        )
+        if metrics is not None:
+            metrics.count(
+                "comparisons", len(title_ids) * len(file_ids), engine=token_engine
+            )
+        # Converting the positions into ids (empty results stay as -1)
+        title_table.updateResults(
+            title_ids, numpy.where(indices >= 0, file_ids[indices], -1), scores
+        )
+        file_table.setResults(
+            file_ids,
+            numpy.where(file_results >= 0, title_ids[file_results], -1),
+            file_scores,
+        )
+        return
+    # Getting the best 3 files for each title and the best titles for each file
+    title_ids, file_ids, rows, columns, pair_scores = findStagePairs(
+        file_table,
+        title_table,
+        token_engine,
+        score_limit,
+        score_cache,
+        stage_scores,
+        score_pool,
+        metrics,
+        TitleTable.result_limit,
+        FileTable.result_limit,
+        retriever,
+        checkpoint,
+    )
+    # Results below the score limit are never kept (they can't be a match so they don't change the results)
+    indices, scores = sparseTopIndices(rows, columns, pair_scores, len(title_ids), 3)
+    # Rounding the scores after ordering them (like thefuzz does)
+    scores = numpy.round(scores).astype(numpy.int64)
+    # Converting the positions into file ids (empty results stay as -1)
+    result_files = numpy.where(indices >= 0, file_ids[indices], -1)
+
+    # Updating the results for the titles (less than 3 results if there are less than 3 files)
+    title_table.updateResults(title_ids, result_files, scores)
+    # Updating the results for the files from every pair (not only each title's best 3, so a file sees its real best titles)
+    file_table.updateResults(
+        file_ids[columns],
+        title_ids[rows],
+        numpy.round(pair_scores).astype(numpy.int64),
+    )
+
+
+# Ways to pick the matches in each stage
+ASSIGNMENTS = ["greedy", "optimal"]
+
+
+# Function to find the maximum weight matching of rows to columns (each row and column is used at most once)
+# This is the Hungarian algorithm on a sparse graph: a shortest augmenting path (Dijkstra with potentials) is found for each row
+# Every row also has a dummy column with a weight of 0 that only it can use, so a row is left unmatched when that's better
+def maximumWeightMatching(
+    rows: numpy.ndarray,
+    columns: numpy.ndarray,
+    weights: numpy.ndarray,
+    row_count: int,
+    max_weight: int = 100,
+) -> numpy.ndarray:
+    # The edges of each row (costs are max_weight - weight so they're never negative)
+    order = numpy.lexsort((columns, rows))
+    starts = numpy.searchsorted(rows[order], numpy.arange(row_count + 1)).tolist()
+    edge_columns = columns[order].tolist()
+    edge_costs = (max_weight - weights[order]).tolist()
+    # The potentials keep the reduced costs (cost - row potential - column potential) from being negative
+    row_potential = [0] * row_count
+    column_potential = {}
+    row_match = [None] * row_count
+    column_match = {}
+    for start_row in range(row_count):
+        if starts[start_row] == starts[start_row + 1]:
+            continue
+        # Distances to the columns and the row each column was reached from
+        distances = {}
+        previous = {}
+        visited_rows = [(start_row, 0)]
+        heap = []
+
+        # Function to add the edges of a row to the heap (the dummy column is -1 - row)
+        # Columns that aren't matched come first at the same distance, so a search with a lot of tied scores stops at the first free one
+        def addEdges(row: int, distance: int) -> None:
+            base = distance - row_potential[row]
+            for edge in range(starts[row], starts[row + 1]):
+                column = edge_columns[edge]
+                if column not in distances:
+                    heapq.heappush(
+                        heap,
+                        (
+                            base + edge_costs[edge] - column_potential.get(column, 0),
+                            column in column_match,
+                            column,
+                            row,
+                        ),
+                    )
+            dummy = -1 - row
+            if dummy not in distances:
+                heapq.heappush(
+                    heap,
+                    (
+                        base + max_weight - column_potential.get(dummy, 0),
+                        dummy in column_match,
+                        dummy,
+                        row,
+                    ),
+                )
+
+        addEdges(start_row, 0)
+        while True:
+            distance, _, column, row = heapq.heappop(heap)
+            if column in distances:
+                continue
+            distances[column] = distance
+            previous[column] = row
+            # Stop at the first column that isn't matched yet
+            if column not in column_match:
+                break
+            # Otherwise continue from the row that has the column (its matched edge has a reduced cost of 0)
+            matched_row = column_match[column]
+            visited_rows.append((matched_row, distance))
+            addEdges(matched_row, distance)
+        # Updating the potentials so the reduced costs stay not negative
+        for visited_row, row_distance in visited_rows:
+            row_potential[visited_row] += distance - row_distance
+        for visited_column, column_distance in distances.items():
+            column_potential[visited_column] = column_potential.get(
+                visited_column, 0
+            ) - (distance - column_distance)
+        # Flipping the matches along the path
+        while True:
+            row = previous[column]
+            next_column = row_match[row]
+            row_match[row] = column
+            column_match[column] = row
+            if row == start_row:
+                break
+            column = next_column
+    # Rows matched to their dummy column are unmatched (-1)
+    return numpy.array(
+        [-1 if x is None or x < 0 else x for x in row_match], dtype=numpy.intp
+    )
+
+
+# Function to match the titles and files with the highest total score at once (instead of the greedy checkMatching)
+def assignOptimal(
+    file_table: FileTable,
+    title_table: TitleTable,
+    token_engine: int,
+    score_limit: int = 0,
+    score_cache: Optional[ScoreCache] = None,
+    stage_scores: Optional[
+        Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    ] = None,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+    retriever: Optional[NgramRetriever] = None,
+) -> None:
+    # Every pair above the score limit is an edge
+    title_ids, file_ids, rows, columns, pair_scores = findStagePairs(
+        file_table,
+        title_table,
+        token_engine,
+        score_limit,
+        score_cache,
+        stage_scores,
+        score_pool,
+        metrics,
+        retriever=retriever,
+    )
+    scores = numpy.round(pair_scores).astype(numpy.int64)
+    matched = maximumWeightMatching(rows, columns, scores, len(title_ids))
+    # The iteration is how far down the title's results the file was (0 is the best file for the title)
+    order = numpy.lexsort((columns, -pair_scores, rows))
+    ranks = dict(
+        zip(
+            zip(rows[order].tolist(), columns[order].tolist()),
+            zip(groupRanks(rows[order]).tolist(), scores[order].tolist()),
+        )
+    )
+    count = 0
+    for row in numpy.flatnonzero(matched >= 0).tolist():
+        column = int(matched[row])
+        rank, score = ranks[(row, column)]
+        title_table.updateMatch(
+            int(title_ids[row]), int(file_ids[column]), score, rank, token_engine
+        )
+        file_table.used[file_ids[column]] = True
+        count += 1
+    logger.info(f"Optimal assignment: {count} matches from {len(rows)} pairs")
+    if metrics is not None:
+        metrics.count("matches", count, stage=token_engine, iteration="optimal")
 
 
 # Function to check for matching titles
 def checkValue(
-    file_value: str, title_value: str, search: int, score_criteria: int
+    file_id: int, result_file: int, result_score: int, score_criteria: int
 ) -> bool:
-    # Get the result
-    result = getCheckValue(title_value, search)
-    # Check that file names match
-    if file_value == result[0]:
+    # Check that the files match (an empty result is -1 so it never matches)
+    if file_id == result_file:
         # Check that the file is above a certain score (could do this in the first conditional statement, but too bad never nesters)
-        if result[1] >= score_criteria:
+        if result_score >= score_criteria:
             return True
         else:
             return False
@@ -455,118 +3018,152 @@ def checkValue(
 
 # Function to check if the title and files are matching
 def checkMatching(
-    files: pandas.Series,
-    titles: pandas.Series,
+    files: FileTable,
+    titles: TitleTable,
     search: int,
     score_criteria: int,
     token_engine: int,
-) -> pandas.Series:
-    results = {"yes": 0, "no": 0}
-    # Iterating through all of the files
-    for ind, value in enumerate(files):
-        found_file = False
+) -> Dict[str, int]:
+    # Getting plain lists of the results (much faster to index than the arrays one value at a time)
+    file_ids = files.remaining().tolist()
+    title_scores = titles.result_score[:, search].tolist()
+    matches = pickMatches(
+        file_ids,
+        files.result_title.tolist(),
+        titles.result_file[:, search].tolist(),
+        title_scores,
+        score_criteria,
+        titles.checkMatch,
+    )
+    for file_id, title_id in matches:
+        # Mark the file as used (so that it wont be used in further results)
+        files.used[file_id] = True
+        # Add match information to to the title
+        titles.updateMatch(
+            title_id,
+            file_id,
+            title_scores[title_id],  # Score
+            search,  # 0, 1, 2 Iteration (what choice was it)
+            token_engine,  # What engine is being used
+        )
+    results = {"yes": len(matches), "no": len(file_ids) - len(matches)}
+    logger.info(f"Iteration {search}: {results}")
+    return results
+
+
+# Function to pick the matches of one search from plain lists of the results (the tables and the small jobs both use this)
+# Each file goes to the first of its titles that has the file as this result and doesn't have a match yet
+def pickMatches(
+    file_ids: List[int],
+    file_results: List[List[int]],
+    title_files: List[int],
+    title_scores: List[int],
+    score_criteria: int,
+    has_match: Callable[[int], bool],
+) -> List[Tuple[int, int]]:
+    matches = []
+    picked = set()
+    # Iterating through all of the files that haven't been used
+    for file_id in file_ids:
         # Check each of the results to see if this file was the top match
-        for ind, x_result in enumerate(value.results):
+        for title_id in file_results[file_id]:
+            # The rest of the results are empty
+            if title_id < 0:
+                break
             # Check the different location depending on the search argument
             if checkValue(
-                value.title, titles[pathHash(x_result[0])], search, score_criteria
+                file_id, title_files[title_id], title_scores[title_id], score_criteria
             ):
                 # Make sure that the title hasn't already been assigned a file
-                if not titles[pathHash(x_result[0])].checkMatch():
-                    # Update the title item
-                    found_file = True
-                    results["yes"] = results["yes"] + 1
-                    # Remove the file from series (so that it wont be used in further results)
-                    files = files.drop(
-                        pathHash(value.title)
-                    )  # Probably not the most efficient, but it's this or an if statement on every class to check if it's been used or not
-                    # Add match information to to the title
-                    titles[pathHash(x_result[0])].updateMatch(
-                        [
-                            value.path,  # Full path
-                            value.name,  # Name and file type
-                            value.title,  # Just the name
-                            value.ftype,  # File or directory
-                            getCheckValue(titles[pathHash(x_result[0])], search)[
-                                1
-                            ],  # Score
-                            search,  # 0, 1, 2 Iteration (what choice was it)
-                            score_criteria,  # Minimum score
-                            token_engine,  # What engine is being used
-                        ]
-                    )
-                    # Could also probably save the entire class object of the file into the title, but I don't want to do that
-                    # You also really only need the path and get the other name aspects from that, but I'm saving them
+                if title_id not in picked and not has_match(title_id):
+                    picked.add(title_id)
+                    matches.append((file_id, title_id))
                     # Break from the loop to go onto the next file (don't break if the file was already used!)
                     break
-        if not found_file:
-            results["no"] = results["no"] + 1
-    # Return the unmatched files
-    logger.info(f"Iteration {search}: {results}")
-    return files
+    return matches
 
 
 # Function to update the input dataframe with the title information
 def updateInputDataframe(
-    title_classes: pandas.Series, input_df: pandas.DataFrame
-) -> pandas.Series:
-    found_list = []
-    # Go through all of the titles
-    for title in title_classes:
-        # If the title has a match
-        if len(title.match_result) != 0:
-            # Update the input data frame
-            input_df.loc[title.ind, "Path"] = title.match_result[1]
-            # Add extra information to the df
-            input_df.loc[title.ind, "Score"] = title.match_result[4]
-            input_df.loc[title.ind, "Engine"] = title.match_result[7]
-            input_df.loc[title.ind, "Iteration"] = title.match_result[5]
-            # Add the file name to the drop list
-            found_list.append(pathHash(title.title))
-    # Drop the titles when we're not iterating through the list (could be problematic)
-    title_classes = title_classes.drop(found_list)
-    return title_classes
-
-
-# Function to clear the results from the classes
-def clearResults(file_classes: pandas.Series, title_classes: pandas.Series) -> None:
-    for file in file_classes:
-        file: (
-            FileFuzzResult  # Does this work to specify the variable type in a for loop?
-        )
-        file.clearResults()
-        # file.results = [] # Could also do something like this directly, but we fuck with getters and setters
-    for title in title_classes:
-        title: TitleFuzzResult
-        title.clearResults()
+    title_table: TitleTable, file_table: FileTable, input_df: pandas.DataFrame
+) -> None:
+    # All of the titles that were matched and haven't been added yet
+    title_ids = numpy.flatnonzero((title_table.match_file >= 0) & ~title_table.used)
+    # Update the input data frame with the file and the extra information (in one assignment)
+    writeMatches(
+        input_df,
+        title_table.ind[title_ids],
+        [file_table.name[x] for x in title_table.match_file[title_ids].tolist()],
+        title_table.match_score[title_ids].tolist(),
+        title_table.match_engine[title_ids].tolist(),
+        title_table.match_iteration[title_ids].tolist(),
+    )
+    # Mark the titles as used (so they wont be searched for again)
+    title_table.used[title_ids] = True
+
+
+# Function to clear the results from the tables
+def clearResults(file_table: FileTable, title_table: TitleTable) -> None:
+    file_table.clearResults()
+    title_table.clearResults()
 
 
 # Function to check all 3 levels of matching
 def checkAllMatching(
-    files: pandas.Series, titles: pandas.Series, score_criteria: int, token_engine: int
-) -> pandas.Series:
-    if len(files) != 0:
-        files = checkMatching(files, titles, 0, score_criteria, token_engine)
-    if len(files) != 0:
-        files = checkMatching(files, titles, 1, score_criteria, token_engine)
-    if len(files) != 0:
-        files = checkMatching(files, titles, 2, score_criteria, token_engine)
-    return files
+    files: FileTable,
+    titles: TitleTable,
+    score_criteria: int,
+    token_engine: int,
+    metrics: Optional[RunMetrics] = None,
+) -> None:
+    for search in range(0, 3):
+        if len(files.remaining()) != 0:
+            results = checkMatching(files, titles, search, score_criteria, token_engine)
+            if metrics is not None:
+                metrics.count(
+                    "matches", results["yes"], stage=token_engine, iteration=search
+                )
 
 
 # Function to create the logger
 def createLogger(logger_name: str) -> logging.Logger:
     logger = logging.getLogger(logger_name)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    # Only add the handler once (in case the script is ran more than once in the same process)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
     logger.setLevel(logging.INFO)
     return logger
 
 
+# Function to parse a score limit or a range of them (START-STOP with an optional :STEP, both ends are included)
+def parseScoreLimits(value: str) -> List[int]:
+    try:
+        if "-" in value:
+            bounds, _, step = value.partition(":")
+            start, stop = (int(x) for x in bounds.split("-"))
+            limits = list(range(start, stop + 1, int(step or 1)))
+        else:
+            limits = [int(value)]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'The score limit must be a number or START-STOP[:STEP], not "{value}"'
+        )
+    if len(limits) == 0:
+        raise argparse.ArgumentTypeError(
+            f'The range of score limits "{value}" is empty (START has to be at most STOP)'
+        )
+    if not all(0 <= x <= 100 for x in limits):
+        raise argparse.ArgumentTypeError(
+            f'The score limits must be 0 to 100, not "{value}"'
+        )
+    return limits
+
+
 # Function to set up CLI arguments
 def createCliArgs() -> UserPaths:
     # Creating the cli arguments
@@ -596,11 +3193,11 @@ def createCliArgs() -> UserPaths:
     parser.add_argument(
         "-s",
         "--score_limit",
-        help="What the score must be for a title and file to match. Default: 90. Must be 0 to 100",
-        type=int,
-        choices=range(0, 101),
+        help="What the score must be for a title and file to match. Default: 90. Must be 0 to 100. More than one limit (or a range like 80-95 or 80-95:5) sweeps them: the pairs are scored once and a csv is written for each limit, along with a summary",
+        type=parseScoreLimits,
+        nargs="+",
         metavar="0-100",
-        default=90,  # No reason for this specific limit, just a starting point
+        default=[[90]],  # No reason for this specific limit, just a starting point
     )
     parser.add_argument(
         "-e",
@@ -611,6 +3208,166 @@ def createCliArgs() -> UserPaths:
         metavar="-1-5",
         default=-1,
     )
+    parser.add_argument(
+        "-c",
+        "--cache_path",
+        help="Path to a cache file that stores the scores between runs (only new titles and files are scored). Default: no cache",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--cache_size",
+        help="The most scores to keep in the cache file. Default: 1000000",
+        type=int,
+        default=1000000,
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest_path",
+        help="Path to a manifest file of the files and matches from the last run. Only new titles and files are matched, the rest of the matches are carried forward. Default: no manifest",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "-d",
+        "--depth",
+        help="How many levels of subdirectories to search for files. Default: 0 (only the files directory). -1 searches every level",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--include",
+        help="Only match files and directories with names matching this glob pattern (can be used more than once). Default: everything",
+        action="append",
+    )
+    parser.add_argument(
+        "--exclude",
+        help="Skip files and directories with names matching this glob pattern, excluded directories aren't searched either (can be used more than once). Default: nothing",
+        action="append",
+    )
+    parser.add_argument(
+        "--scan_threads",
+        help="How many directories to scan at the same time. Default: 8",
+        type=int,
+        default=8,
+    )
+    parser.add_argument(
+        "--single_pass",
+        help="With -e -1, score every engine in one pass and replay the stages from the stored scores (uses more memory, doesn't use the cache)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fold_unicode",
+        help="Take the accents off of letters and fold compatibility characters (like full width letters) before comparing",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--collapse_separators",
+        help="Turn runs of punctuation, underscores, and whitespace into single spaces before comparing",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--strip_tags",
+        help="Remove text matching this regular expression (case insensitive) before comparing (can be used more than once). Default: nothing",
+        action="append",
+    )
+    parser.add_argument(
+        "--strip_media_tags",
+        help="Remove common media tags (bracketed text, years in parentheses, resolutions, codecs, and sources) before comparing",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="How many processes to split the titles between for scoring. Default: 1",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--shard",
+        help="Only score the K-th of N parts of the titles (like 1/4) and write the partial results to the output path instead of a csv",
+    )
+    parser.add_argument(
+        "--merge",
+        help="Merge the partial results of every shard and write the csv (use the same titles, files, score limit, and engine as the shards)",
+        type=pathlib.Path,
+        nargs="+",
+    )
+    parser.add_argument(
+        "-a",
+        "--assignment",
+        help="How to pick the matches in each stage: greedy (mutual best results, the original way) or optimal (the highest total score of every pair above the score limit). Default: greedy",
+        choices=ASSIGNMENTS,
+        default="greedy",
+    )
+    parser.add_argument(
+        "--candidates",
+        help="Only score this many files for each title, picked by how similar their character n-grams are (tf-idf vectors). Made for huge sets of files, more candidates find more of the matches. Default: 0 (every file is scored)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--ngram_size",
+        help="How many characters are in each n-gram for --candidates. Default: 3",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--score_map",
+        help="Directory to score every pair into a memory mapped matrix (one byte per score) instead of keeping the scores in memory. Made for sets of titles and files too big for memory, the memory is bounded by the tile size",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--tile_size",
+        help="How many titles and files are scored at once for --score_map. Default: 2048",
+        type=int,
+        default=2048,
+    )
+    parser.add_argument(
+        "--checkpoint_path",
+        help="Path to save the progress after every stage (and every --checkpoint_interval seconds inside a stage), so a stopped run can be continued with --resume. It's removed once the output is written",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        help="Seconds between saving the progress inside a stage. Default: 600",
+        type=float,
+        default=600.0,
+    )
+    parser.add_argument(
+        "--resume",
+        help="Continue from the checkpoint at --checkpoint_path (the results are the same as a run that wasn't stopped)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running after the first match and match the files as they're added, renamed, or removed (until ctrl+c). The changed rows are added to the end of the output csv, and it's rewritten when stopped",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        help="Seconds between reading the directories when watching without inotify. Default: 2",
+        type=float,
+        default=2.0,
+    )
+    parser.add_argument(
+        "--serve",
+        help="Answer title queries over http at HOST:PORT (or PORT on 127.0.0.1) instead of matching the input file. The files are only read once",
+    )
+    parser.add_argument(
+        "--query_cache_size",
+        help="How many query answers the server remembers. Default: 4096",
+        type=int,
+        default=4096,
+    )
+    parser.add_argument(
+        "--metrics_path",
+        help="Path to write the time, counts, and memory of every step (a prometheus textfile if it ends in .prom, otherwise json)",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the matching in cProfile and write the stats next to the output csv (with a .prof extension)",
+        action="store_true",
+    )
     # Getting cli arguments
     cli_args = parser.parse_args()
     # Checking the arguments
@@ -618,68 +3375,1011 @@ def createCliArgs() -> UserPaths:
     return user_args
 
 
-# Creating the global variables (so I don't have to pass them into every function)
-# Creating a logger
-logger = createLogger("Title Matcher")
-# Get the command line (user) arguments
-user_args = createCliArgs()
-
-# Create the initial data frame (source data frames)
-o_input_df, o_file_df = createInitialDataframes(
-    user_args.input_csv, user_args.file_directory
-)
-
-# If the user isn't using a specific engine iterate through all of them
-if user_args.score_engine == -1:
-    # I want to loop all of this for every score engine type...
-    for stage in range(0, 6):
-        # If it's the first stage create the starting variables from the original inputs
-        if stage == 0:
-            # Creating the desired data frames
-            search_df, file_titles = createDesiredDataframes(o_input_df, o_file_df)
-            # Create the classes to store the data
-            file_classes, title_classes = createClasses(file_titles, search_df)
-        # If not create the files from the previous iterations
-        else:
-            # Only need ot remake the search_df. I can use the same class series'
-            search_df = o_input_df[o_input_df["Path"].isna()]
+# Function to get the engines to run
+def getStages(score_engine: int) -> List[int]:
+    # If the user isn't using a specific engine iterate through all of them
+    if score_engine == -1:
+        return list(range(0, 6))
+    # If the user is using a specific engine just use that
+    else:
+        return [score_engine]
+
+
+# Function to get a fingerprint of the titles and files (so partial results are only merged with the same inputs)
+def inputFingerprint(search_df: pandas.DataFrame, file_titles: pandas.DataFrame) -> str:
+    digest = hashlib.sha256()
+    paths = map(os.path.join, file_titles["Directory"], file_titles["Base"])
+    for value in list(search_df["Title"]) + list(paths):
+        digest.update(value.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
 
+# Function to score one shard of the titles with every stage's engine (for splitting a job between machines)
+# Every pair above the score limit is kept, since the later stages depend on which titles and files the earlier stages matched
+def runShard(
+    o_input_df: pandas.DataFrame,
+    o_file_df: pandas.DataFrame,
+    score_limit: int,
+    score_engine: int,
+    shard: Tuple[int, int],
+    normalizer: Optional[Normalizer] = None,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> Tuple[dict, Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]]:
+    search_df, file_titles = createDesiredDataframes(o_input_df, o_file_df)
+    file_table, title_table = createTables(
+        file_titles, search_df, normalizer=normalizer
+    )
+    # The titles are split into N parts in order (K is counted from 1)
+    title_ids = numpy.array_split(title_table.remaining(), shard[1])[shard[0] - 1]
+    stage_scores = scoreAllEngines(
+        file_table,
+        title_table,
+        score_limit,
+        score_pool,
+        getStages(score_engine),
+        title_ids,
+        metrics,
+    )
+    # The settings that every shard has to share
+    meta = {
+        "shard": shard[0],
+        "shards": shard[1],
+        "score_limit": score_limit,
+        "score_engine": score_engine,
+        "normalizer": None if normalizer is None else normalizer.settings(),
+        "fingerprint": inputFingerprint(search_df, file_titles),
+    }
+    return (meta, stage_scores)
+
+
+# Function to write the partial results of a shard (the title and file ids and the unrounded scores for every engine)
+def writePartialResults(
+    out_path: pathlib.Path,
+    meta: dict,
+    stage_scores: Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]],
+) -> None:
+    arrays = {"meta": numpy.array(json.dumps(meta))}
+    for engine, (titles, files, scores) in stage_scores.items():
+        arrays[f"titles_{engine}"] = titles.astype(numpy.int64)
+        arrays[f"files_{engine}"] = files.astype(numpy.int64)
+        arrays[f"scores_{engine}"] = scores
+    # Writing through a file object so numpy doesn't add its own extension
+    with open(out_path, "wb") as out_file:
+        numpy.savez_compressed(out_file, **arrays)
+    logger.info(f'Wrote the partial results at "{out_path}"')
+
+
+# Function to read and combine the partial results of every shard
+def mergePartialResults(
+    merge_paths: List[pathlib.Path],
+    o_input_df: pandas.DataFrame,
+    o_file_df: pandas.DataFrame,
+    score_limit: int,
+    score_engine: int,
+    normalizer: Optional[Normalizer] = None,
+) -> Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+    fingerprint = inputFingerprint(*createDesiredDataframes(o_input_df, o_file_df))
+    settings = None if normalizer is None else normalizer.settings()
+    engines = getStages(score_engine)
+    parts = {engine: ([], [], []) for engine in engines}
+    shards = []
+    for merge_path in merge_paths:
+        with numpy.load(merge_path) as partial:
+            meta = json.loads(str(partial["meta"]))
+            # Every shard has to come from the same job as this one
+            if (
+                meta["fingerprint"] != fingerprint
+                or meta["score_limit"] != score_limit
+                or meta["score_engine"] != score_engine
+                or meta.get("normalizer") != settings
+            ):
+                logger.critical(
+                    f'The partial results at "{merge_path}" are from different titles, files, or settings'
+                )
+                sys.exit()
+            shards.append((meta["shard"], meta["shards"]))
+            for engine in engines:
+                for part, name in zip(parts[engine], ["titles", "files", "scores"]):
+                    part.append(partial[f"{name}_{engine}"])
+    # Every shard has to be there exactly once
+    counts = {x[1] for x in shards}
+    if len(counts) != 1 or sorted(x[0] for x in shards) != list(
+        range(1, counts.pop() + 1)
+    ):
+        logger.critical(f"The shards {sorted(shards)} aren't a complete set")
+        sys.exit()
+    logger.info(f"Merged the partial results of {len(shards)} shards")
+    return {
+        engine: (
+            numpy.concatenate(titles).astype(numpy.intp),
+            numpy.concatenate(files).astype(numpy.intp),
+            numpy.concatenate(scores),
+        )
+        for engine, (titles, files, scores) in parts.items()
+    }
+
+
+# Function to run the matching stages (updates the input data frame with the matches)
+def runStages(
+    o_input_df: pandas.DataFrame,
+    o_file_df: pandas.DataFrame,
+    score_limit: int,
+    score_engine: int,
+    score_cache: Optional[ScoreCache] = None,
+    fresh_titles: Optional[pandas.Series] = None,
+    fresh_files: Optional[pandas.Series] = None,
+    single_pass: bool = False,
+    normalizer: Optional[Normalizer] = None,
+    score_pool: Optional[ScorePool] = None,
+    stage_scores: Optional[
+        Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    ] = None,
+    metrics: Optional[RunMetrics] = None,
+    assignment: str = "greedy",
+    retriever: Optional[NgramRetriever] = None,
+    score_map: Optional[ScoreMap] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Dict[object, str]:
+    with timeStep(metrics, "createTables"):
+        # Creating the desired data frames
+        search_df, file_titles = createDesiredDataframes(o_input_df, o_file_df)
+        # Create the tables to store the data (used for every stage, matched titles and files are marked as used)
+        file_table, title_table = createTables(
+            file_titles, search_df, fresh_files, fresh_titles, normalizer
+        )
+
+    stages = getStages(score_engine)
+    # Continue from the last checkpoint (if the user is resuming)
+    if checkpoint is not None:
+        checkpoint.meta = {
+            "fingerprint": inputFingerprint(search_df, file_titles),
+            "score_limit": score_limit,
+            "score_engine": score_engine,
+            "assignment": assignment,
+            "normalizer": None if normalizer is None else normalizer.settings(),
+        }
+        if checkpoint.resume:
+            next_stage = checkpoint.load(file_table, title_table)
+            stages = [x for x in stages if x >= next_stage]
+            updateInputDataframe(title_table, file_table, o_input_df)
+    # Score every engine at once if the user wants a single pass (the stages only use the stored scores)
+    # The scores are already given when merging shards
+    if stage_scores is None and single_pass and len(stages) > 1:
+        with timeStep(metrics, "scoreAllEngines"):
+            stage_scores = scoreAllEngines(
+                file_table,
+                title_table,
+                score_limit,
+                score_pool,
+                metrics=metrics,
+            )
+    matchTables(
+        file_table,
+        title_table,
+        o_input_df,
+        stages,
+        score_limit,
+        score_cache,
+        stage_scores,
+        score_pool,
+        metrics,
+        assignment,
+        retriever,
+        score_map,
+        checkpoint,
+    )
+    return matchedPaths(
+        title_table, file_table, numpy.flatnonzero(title_table.match_file >= 0)
+    )
+
+
+# Function to get the path of the file matched to each title (by the row of the input data frame)
+# The output only has the name, so this is what tells apart files with the same name in different directories
+def matchedPaths(
+    title_table: TitleTable, file_table: FileTable, title_ids: numpy.ndarray
+) -> Dict[object, str]:
+    paths = {}
+    for title_id in title_ids:
+        file_id = title_table.match_file[title_id]
+        paths[title_table.ind[title_id]] = os.path.join(
+            file_table.directories[file_table.directory[file_id]],
+            file_table.base[file_id],
+        )
+    return paths
+
+
+# Function to run the stages on the tables (the tables can be used again, like in watch mode)
+def matchTables(
+    file_table: FileTable,
+    title_table: TitleTable,
+    o_input_df: pandas.DataFrame,
+    stages: List[int],
+    score_limit: int,
+    score_cache: Optional[ScoreCache] = None,
+    stage_scores: Optional[
+        Dict[int, Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+    ] = None,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+    assignment: str = "greedy",
+    retriever: Optional[NgramRetriever] = None,
+    score_map: Optional[ScoreMap] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> None:
+    for stage in stages:
+        if metrics is not None:
+            metrics.set("titles_remaining", len(title_table.remaining()), stage=stage)
+            metrics.set("files_remaining", len(file_table.remaining()), stage=stage)
         # Check if there are any more files AND titles to connect
-        if len(file_classes) != 0 and len(title_classes) != 0:
-            # Creating series of the similarities  (I could just get the file titles from the title_classes...)
-            findSimilarity(file_classes, title_classes, search_df, stage)
-            # Check if the file and titles match (returns remaining files)
-            file_classes = checkAllMatching(
-                file_classes, title_classes, user_args.score_limit, stage
-            )
-            # Update the input dataframe with the title results
-            title_classes = updateInputDataframe(title_classes, o_input_df)
-            # Clear the results (if not it will cause errors if any class still references a already used, and remove, title or file)
-            clearResults(file_classes, title_classes)
+        if len(file_table.remaining()) != 0 and len(title_table.remaining()) != 0:
+            if assignment == "optimal":
+                # Matching every pair above the score limit at once (marks the matched files as used)
+                with timeStep(metrics, "assignOptimal", stage=stage):
+                    assignOptimal(
+                        file_table,
+                        title_table,
+                        stage,
+                        score_limit,
+                        score_cache,
+                        stage_scores,
+                        score_pool,
+                        metrics,
+                        retriever,
+                    )
+            else:
+                # Scoring the similarities of the remaining titles and files
+                with timeStep(metrics, "findSimilarity", stage=stage):
+                    findSimilarity(
+                        file_table,
+                        title_table,
+                        stage,
+                        score_limit,
+                        score_cache,
+                        stage_scores,
+                        score_pool,
+                        metrics,
+                        retriever,
+                        score_map,
+                        checkpoint,
+                    )
+                # Check if the file and titles match (marks the matched files as used)
+                with timeStep(metrics, "checkAllMatching", stage=stage):
+                    checkAllMatching(
+                        file_table, title_table, score_limit, stage, metrics
+                    )
+            # Update the input dataframe with the title results (marks the matched titles as used)
+            with timeStep(metrics, "updateInputDataframe", stage=stage):
+                updateInputDataframe(title_table, file_table, o_input_df)
+            # Clear the results (if not it will cause errors if any result still references a already used title or file)
+            clearResults(file_table, title_table)
         # If there's no possible matches left just break
         else:
             break
         logger.info(f"stage {stage} completed")
-# If the user is using a specific engine just use that
-else:
-    # Creating the desired data frames
+        # Save the progress after every stage (the next stage is where a resumed run starts)
+        if checkpoint is not None:
+            checkpoint.save(file_table, title_table, stage + 1)
+
+
+# Function to match titles to files without reading or writing anything (for using this as a library)
+def match(
+    titles: Iterable[str],
+    files: Iterable[Union[str, pathlib.Path]],
+    score_limit: int = 90,
+    engine: int = -1,
+    directories: Iterable[Union[str, pathlib.Path]] = (),
+    paths: Optional[Iterable[Optional[str]]] = None,
+    score_cache: Optional[ScoreCache] = None,
+    normalizer: Optional[Normalizer] = None,
+    score_pool: Optional[ScorePool] = None,
+    assignment: str = "greedy",
+    retriever: Optional[NgramRetriever] = None,
+    score_map: Optional[ScoreMap] = None,
+) -> pandas.DataFrame:
+    # Checking the arguments the same way the cli does
+    if score_limit not in range(0, 101):
+        raise ValueError(f"The score limit must be 0 to 100, not {score_limit}")
+    if engine not in range(-1, 6):
+        raise ValueError(f"The score engine must be -1 to 5, not {engine}")
+    if assignment not in ASSIGNMENTS:
+        raise ValueError(
+            f"The assignment must be one of {ASSIGNMENTS}, not {assignment}"
+        )
+    # Create the data frames from the titles and files
+    input_df, file_df = createMemoryDataframes(titles, files, directories, paths)
+    # Match the titles and files
+    runStages(
+        input_df,
+        file_df,
+        score_limit,
+        engine,
+        score_cache,
+        normalizer=normalizer,
+        score_pool=score_pool,
+        assignment=assignment,
+        retriever=retriever,
+        score_map=score_map,
+    )
+    # Return the same columns that would be written to the csv
+    return input_df.drop("Index", axis=1)
+
+
+# Function to get the path of the csv for one score limit of a sweep (or the summary)
+def sweepPath(out_path: pathlib.Path, name: Union[int, str]) -> pathlib.Path:
+    return out_path.with_name(f"{out_path.stem}_{name}{out_path.suffix}")
+
+
+# Function to match the titles and files at every score limit (each engine scores the pairs once at the lowest limit for every limit)
+def runSweep(
+    o_input_df: pandas.DataFrame,
+    o_file_df: pandas.DataFrame,
+    score_limits: List[int],
+    score_engine: int,
+    out_path: pathlib.Path,
+    normalizer: Optional[Normalizer] = None,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+    assignment: str = "greedy",
+) -> None:
+    stages = getStages(score_engine)
     search_df, file_titles = createDesiredDataframes(o_input_df, o_file_df)
-    # Create the classes to store the data
-    file_classes, title_classes = createClasses(file_titles, search_df)
-    # Check if there are any more files AND titles to connect
-    if len(file_classes) != 0 and len(title_classes) != 0:
-        # Creating series of the similarities  (I could just get the file titles from the title_classes...)
-        findSimilarity(file_classes, title_classes, search_df, user_args.score_engine)
-        # Check if the file and titles match (returns remaining files)
-        file_classes = checkAllMatching(
-            file_classes, title_classes, user_args.score_limit, user_args.score_engine
-        )
-        # Update the input dataframe with the title results
-        title_classes = updateInputDataframe(title_classes, o_input_df)
-    logger.info("stage completed")
-
-# Write the results to a csv file
-writeCsv(user_args.output_csv, o_input_df)
+    # Every limit has its own tables and input data frame, and the scoring tables hold the processed strings
+    file_table, title_table = createTables(
+        file_titles, search_df, normalizer=normalizer
+    )
+    sweeps = []
+    for score_limit in score_limits:
+        tables = createTables(file_titles, search_df, normalizer=normalizer)
+        sweeps.append((score_limit, tables[0], tables[1], o_input_df.copy()))
+    for stage in stages:
+        # Only the titles and files that are left at any of the limits are scored
+        file_table.used[:] = numpy.logical_and.reduce([x[1].used for x in sweeps])
+        title_table.used[:] = numpy.logical_and.reduce([x[2].used for x in sweeps])
+        if len(file_table.remaining()) == 0 or len(title_table.remaining()) == 0:
+            break
+        with timeStep(metrics, "scoreAllEngines", stage=stage):
+            all_scores = scoreAllEngines(
+                file_table,
+                title_table,
+                min(score_limits),
+                score_pool,
+                [stage],
+                metrics=metrics,
+            )
+        pair_titles, pair_files, pair_scores = all_scores[stage]
+        for score_limit, limit_files, limit_titles, input_df in sweeps:
+            # Each limit only sees the pairs that round to at least the limit (the pairs of used titles and files are skipped when matching)
+            keep = numpy.round(pair_scores) >= score_limit
+            stage_scores = {
+                stage: (pair_titles[keep], pair_files[keep], pair_scores[keep])
+            }
+            # Everything recorded while matching at a limit gets the limit as a label
+            with labelStep(metrics, score_limit=score_limit), timeStep(
+                metrics, "matchTables", stage=stage
+            ):
+                matchTables(
+                    limit_files,
+                    limit_titles,
+                    input_df,
+                    [stage],
+                    score_limit,
+                    stage_scores=stage_scores,
+                    score_pool=score_pool,
+                    metrics=metrics,
+                    assignment=assignment,
+                )
+    summary = []
+    for score_limit, _, _, input_df in sweeps:
+        writeCsv(sweepPath(out_path, score_limit), input_df)
+        # Counting the matches of every stage and iteration (the titles that already had a path don't have a score)
+        matched = input_df[input_df["Score"].notna()]
+        counts = matched.groupby(["Engine", "Iteration"]).size()
+        for stage in stages:
+            # The greedy iterations are 0 to 2, but the optimal assignment's iteration is the file's rank for the title (so it can be higher)
+            searches = set(range(0, 3))
+            searches.update(int(y) for x, y in counts.index if x == stage)
+            for search in sorted(searches):
+                summary.append(
+                    [score_limit, stage, search, int(counts.get((stage, search), 0))]
+                )
+        logger.info(
+            f"Score limit {score_limit}: {len(matched)} of {len(search_df)} titles matched"
+        )
+    summary_df = pandas.DataFrame(
+        summary, columns=["Score Limit", "Engine", "Iteration", "Matches"]
+    )
+    summary_path = sweepPath(out_path, "summary")
+    try:
+        summary_df.to_csv(summary_path, index=False, encoding="utf-8-sig")
+        logger.info(f'Wrote the summary at "{summary_path}"')
+    except:
+        logger.error(f'The file at "{summary_path}" couldn\'t be written')
+        sys.exit()
+
+
+# Jobs with at most this many title and file pairs are matched without the data frames (starting pandas takes longer than matching them)
+SMALL_JOB_PAIRS = 10000
+
+# Cells that pandas reads as missing (the small jobs leave the titles with these to pandas)
+NA_STRINGS = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+
+
+# Function to check if the job can be matched without the data frames (only the plain matching, nothing else is read or written)
+def isSmallJobAllowed(user_args: UserPaths, metrics: Optional[RunMetrics]) -> bool:
+    return (
+        metrics is None
+        and user_args.cache_path is None
+        and user_args.manifest_path is None
+        and user_args.shard is None
+        and len(user_args.merge_paths) == 0
+        and not user_args.watch
+        and user_args.candidates == 0
+        and user_args.score_map is None
+        and len(user_args.score_limits) == 1
+        and user_args.checkpoint_path is None
+        and user_args.assignment == "greedy"
+    )
+
+
+# Function to read the titles and paths of a small csv without pandas (None if it's too big or pandas would read it differently)
+def readSmallCsv(
+    csv_path: pathlib.Path, max_rows: int
+) -> Optional[Tuple[List[str], List[Optional[str]]]]:
+    titles, paths = [], []
+    try:
+        with open(csv_path, encoding="utf-8-sig", newline="") as csv_file:
+            # Blank lines are skipped like pandas does
+            rows = (x for x in csv.reader(csv_file) if len(x) != 0)
+            header = next(rows, None)
+            if header is None or len(header) < 2:
+                return None
+            for row in rows:
+                # Missing titles and rows longer than the header are left to pandas (and its errors)
+                if len(row) > len(header) or row[0] in NA_STRINGS or row[0].isspace():
+                    return None
+                titles.append(row[0])
+                paths.append(
+                    row[1] if len(row) > 1 and row[1] not in NA_STRINGS else None
+                )
+                if len(titles) > max_rows:
+                    return None
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return None
+    return (titles, paths)
+
+
+# Function to match the titles and files of a small job with plain lists (the same stages, results, and checks as the tables)
+def matchSmall(
+    titles: List[str],
+    paths: List[Optional[str]],
+    items: List[Tuple[str, bool]],
+    score_limit: int,
+    score_engine: int,
+    normalizer: Optional[Normalizer] = None,
+) -> List[List[object]]:
+    # Only the titles without a path are searched for, and the files that are already someone's path are skipped
+    search = [x for x, path in enumerate(paths) if path is None]
+    found = {x for x in paths if x is not None}
+    names, file_titles = [], []
+    for path, is_file in items:
+        name = entryName(path, is_file)
+        if name not in found:
+            names.append(name)
+            file_titles.append(nameStem(os.path.basename(path)))
+    title_normalized = normalizeStrings([titles[x] for x in search], normalizer)
+    file_normalized = normalizeStrings(file_titles, normalizer)
+    forms = {}
+    title_used = [False] * len(search)
+    file_used = [False] * len(names)
+    # The matched file, score, iteration, and engine of each searched title
+    matches = {}
+    for stage in getStages(score_engine):
+        title_ids = [x for x, used in enumerate(title_used) if not used]
+        file_ids = [x for x, used in enumerate(file_used) if not used]
+        if len(title_ids) == 0 or len(file_ids) == 0:
+            break
+        form = ENGINE_FORMS[stage]
+        if form not in forms:
+            forms[form] = (
+                processStrings(title_normalized, form, True),
+                processStrings(file_normalized, form, False),
+            )
+        queries, choices = forms[form]
+        scorer = SCORE_ENGINES[stage]
+        # Scoring every pair (only the pairs that round to the score limit can be results)
+        title_pairs = {x: [] for x in title_ids}
+        file_pairs = {x: [] for x in file_ids}
+        for title_id in title_ids:
+            for file_id in file_ids:
+                score = scorer(queries[title_id], choices[file_id])
+                if round(score) >= score_limit:
+                    title_pairs[title_id].append((-score, file_id))
+                    file_pairs[file_id].append((-round(score), title_id))
+        # The best 3 files of each title (ordered by score, ties by the lowest file) and the best 5 titles of each file (by rounded score)
+        title_results = [[] for _ in search]
+        for x, pairs in title_pairs.items():
+            title_results[x] = [(y, round(-score)) for score, y in sorted(pairs)[:3]]
+        file_results = [[] for _ in names]
+        for x, pairs in file_pairs.items():
+            file_results[x] = [y for _, y in sorted(pairs)[:5]]
+        # Checking the first, second, and third results with the same picks as checkMatching
+        for search_index in range(0, 3):
+            results = [
+                x[search_index] if len(x) > search_index else (-1, 0)
+                for x in title_results
+            ]
+            title_files = [x[0] for x in results]
+            title_scores = [x[1] for x in results]
+            for file_id, title_id in pickMatches(
+                [x for x in file_ids if not file_used[x]],
+                file_results,
+                title_files,
+                title_scores,
+                score_limit,
+                matches.__contains__,
+            ):
+                file_used[file_id] = True
+                matches[title_id] = (
+                    file_id,
+                    title_scores[title_id],
+                    search_index,
+                    stage,
+                )
+        for title_id in matches:
+            title_used[title_id] = True
+    # Creating the rows of the csv (the titles that weren't matched are left empty)
+    rows = [[x, "" if y is None else y, "", "", ""] for x, y in zip(titles, paths)]
+    for title_id, (file_id, score, iteration, engine) in matches.items():
+        rows[search[title_id]][1:] = [names[file_id], score, engine, iteration]
+    return rows
+
+
+# Function to write the rows of a small job (the same csv as writeCsv)
+def writeSmallCsv(out_path: pathlib.Path, rows: List[List[object]]) -> None:
+    try:
+        with open(out_path, "w", encoding="utf-8-sig", newline="") as csv_file:
+            writer = csv.writer(csv_file, lineterminator=os.linesep)
+            writer.writerow(["Title", "Path", "Score", "Engine", "Iteration"])
+            writer.writerows(rows)
+        logger.info(f'Wrote the file at "{out_path}"')
+    except:
+        logger.error(f'The file at "{out_path}" couldn\'t be written')
+        sys.exit()
+
+
+# Function to match a small job without pandas or numpy (returns False if it isn't small, so it's matched normally)
+def runSmallJob(
+    user_args: UserPaths, items: List[Tuple[str, bool]], normalizer: Normalizer
+) -> bool:
+    if len(items) > SMALL_JOB_PAIRS:
+        return False
+    read = readSmallCsv(user_args.input_csv, SMALL_JOB_PAIRS // max(1, len(items)))
+    if read is None:
+        return False
+    titles, paths = read
+    rows = matchSmall(
+        titles,
+        paths,
+        items,
+        user_args.score_limit,
+        user_args.score_engine,
+        normalizer,
+    )
+    logger.info(
+        f"Matched {sum(x[2] != '' for x in rows)} of {len(rows)} titles as a small job"
+    )
+    writeSmallCsv(user_args.output_csv, rows)
+    return True
+
+
+# Function to run the matching from the command line arguments
+def runMatching(user_args: UserPaths, metrics: Optional[RunMetrics] = None) -> None:
+    normalizer = Normalizer(
+        user_args.fold_unicode,
+        user_args.collapse_separators,
+        user_args.strip_tags,
+    )
+    # Only answer queries (if the user is running the server)
+    if user_args.serve is not None:
+        serveMatches(user_args, normalizer)
+        return
+
+    # Start watching before the files are read (so nothing added while matching is missed)
+    watcher = None
+    if user_args.watch:
+        watcher = DirectoryWatcher(
+            user_args.file_directory,
+            user_args.depth,
+            user_args.include,
+            user_args.exclude,
+            user_args.poll_interval,
+        )
+    # Match small jobs without the data frames (the files are only read once even if the job turns out to be too big)
+    items = None
+    if isSmallJobAllowed(user_args, metrics):
+        items = list(
+            scanFiles(
+                user_args.file_directory,
+                user_args.depth,
+                user_args.include,
+                user_args.exclude,
+                user_args.scan_threads,
+                user_args.file_listing,
+            )
+        )
+        if runSmallJob(user_args, items, normalizer):
+            return
+
+    # Create the initial data frame (source data frames)
+    with timeStep(metrics, "createInitialDataframes"):
+        o_input_df, o_file_df = createInitialDataframes(
+            user_args.input_csv,
+            user_args.file_directory,
+            user_args.depth,
+            user_args.include,
+            user_args.exclude,
+            user_args.scan_threads,
+            user_args.file_listing,
+            items,
+        )
+    if metrics is not None:
+        metrics.set("titles", len(o_input_df))
+        metrics.set("files", len(o_file_df))
+
+    # Start the worker processes (if the user wants more than one)
+    score_pool = None
+    if user_args.workers > 1:
+        score_pool = ScorePool(user_args.workers)
+
+    # Match at every score limit from one scoring (if the user is sweeping the score limit)
+    if len(user_args.score_limits) > 1:
+        runSweep(
+            o_input_df,
+            o_file_df,
+            user_args.score_limits,
+            user_args.score_engine,
+            user_args.output_csv,
+            normalizer,
+            score_pool,
+            metrics,
+            user_args.assignment,
+        )
+        if score_pool is not None:
+            score_pool.close()
+        return
+
+    # Only score one shard of the titles and write the partial results (if the user is splitting the job)
+    if user_args.shard is not None:
+        with timeStep(metrics, "runShard"):
+            meta, stage_scores = runShard(
+                o_input_df,
+                o_file_df,
+                user_args.score_limit,
+                user_args.score_engine,
+                user_args.shard,
+                normalizer,
+                score_pool,
+                metrics,
+            )
+        if score_pool is not None:
+            score_pool.close()
+        writePartialResults(user_args.output_csv, meta, stage_scores)
+        return
+
+    # Combine the partial results of the shards (if the user is merging them)
+    stage_scores = None
+    if len(user_args.merge_paths) > 0:
+        with timeStep(metrics, "mergePartialResults"):
+            stage_scores = mergePartialResults(
+                user_args.merge_paths,
+                o_input_df,
+                o_file_df,
+                user_args.score_limit,
+                user_args.score_engine,
+                normalizer,
+            )
+
+    # Carry forward the matches from the last run (if the user is using a manifest)
+    fresh_titles, fresh_files = None, None
+    if user_args.manifest_path is not None:
+        with timeStep(metrics, "applyManifest"):
+            fresh_titles, fresh_files = applyManifest(
+                readManifest(
+                    user_args.manifest_path, manifestSettings(user_args, normalizer)
+                ),
+                o_input_df,
+                o_file_df,
+                user_args.file_directory,
+            )
+
+    # Only score the n-gram candidates of each title (if the user wants to)
+    retriever = None
+    if user_args.candidates > 0:
+        retriever = NgramRetriever(user_args.candidates, user_args.ngram_size)
+
+    # Score the pairs into a matrix on disk (if the user wants to)
+    score_map = None
+    if user_args.score_map is not None:
+        score_map = ScoreMap(user_args.score_map, user_args.tile_size)
+
+    # Save the progress of the stages (if the user wants to be able to resume)
+    checkpoint = None
+    if user_args.checkpoint_path is not None:
+        checkpoint = Checkpoint(
+            user_args.checkpoint_path, user_args.checkpoint_interval, user_args.resume
+        )
+
+    # Open the score cache (if the user wants to use one)
+    score_cache = None
+    if user_args.cache_path is not None:
+        score_cache = ScoreCache(user_args.cache_path, user_args.cache_size)
+
+    # Match the titles and files
+    matched_paths = runStages(
+        o_input_df,
+        o_file_df,
+        user_args.score_limit,
+        user_args.score_engine,
+        score_cache,
+        fresh_titles,
+        fresh_files,
+        user_args.single_pass,
+        normalizer,
+        score_pool,
+        stage_scores,
+        metrics,
+        user_args.assignment,
+        retriever,
+        score_map,
+        checkpoint,
+    )
+    if score_cache is not None:
+        score_cache.close()
+
+    # Write the results to a csv file
+    with timeStep(metrics, "writeCsv"):
+        writeCsv(user_args.output_csv, o_input_df)
+    # The checkpoint isn't needed once the results are written
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    # Keep matching the entries as they're added (if the user is watching the directory)
+    if watcher is not None:
+        watchFiles(
+            user_args,
+            o_input_df,
+            watcher,
+            normalizer,
+            score_pool,
+            metrics,
+            retriever,
+            matched_paths,
+        )
+        o_file_df = createFileDataframe(watcher.items())
+    if score_pool is not None:
+        score_pool.close()
+
+    # Write the manifest for the next run
+    if user_args.manifest_path is not None:
+        writeManifest(
+            user_args.manifest_path,
+            o_input_df,
+            o_file_df,
+            user_args.file_directory,
+            manifestSettings(user_args, normalizer),
+        )
+
+
+# Function to check the options of a title query (the titles and the engine, limit, and score limit)
+def parseMatchQuery(
+    values: dict, title_key: str
+) -> Tuple[object, Tuple[int, int, int]]:
+    titles = values.get(title_key)
+    if title_key == "title" and not isinstance(titles, str):
+        raise ValueError("A title is needed")
+    if title_key == "titles" and (
+        not isinstance(titles, list) or not all(isinstance(x, str) for x in titles)
+    ):
+        raise ValueError("The titles must be a list of strings")
+    options = []
+    for name, default, low, high in [
+        ("engine", 0, 0, 5),
+        ("limit", 5, 1, 1000),
+        ("score_limit", 0, 0, 100),
+    ]:
+        try:
+            value = int(values.get(name, default))
+        except (TypeError, ValueError):
+            raise ValueError(f"The {name} must be a number")
+        if not low <= value <= high:
+            raise ValueError(f"The {name} must be {low} to {high}, not {value}")
+        options.append(value)
+    return (titles, tuple(options))
+
+
+# Function to answer title queries over http until it's stopped (the files are only read once)
+def serveMatches(user_args: UserPaths, normalizer: Normalizer) -> None:
+    file_df = getFiles(
+        user_args.file_directory,
+        user_args.depth,
+        user_args.include,
+        user_args.exclude,
+        user_args.scan_threads,
+        user_args.file_listing,
+    )
+    MatchHandler.index = MatchIndex(file_df, normalizer, user_args.query_cache_size)
+    server = http.server.ThreadingHTTPServer(user_args.serve, MatchHandler)
+    signal.signal(signal.SIGTERM, stopProcess)
+    host, port = server.server_address[:2]
+    logger.info(f"Answering queries for {len(file_df)} files at http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped answering queries")
+    finally:
+        server.server_close()
+
+
+# Function to stop when the process is asked to stop (the same as pressing ctrl+c)
+def stopProcess(signal_number: int, frame) -> None:
+    raise KeyboardInterrupt
+
+
+# Function to keep matching the entries that are added to the files directory (until it's stopped)
+def watchFiles(
+    user_args: UserPaths,
+    o_input_df: pandas.DataFrame,
+    watcher: DirectoryWatcher,
+    normalizer: Normalizer,
+    score_pool: Optional[ScorePool] = None,
+    metrics: Optional[RunMetrics] = None,
+    retriever: Optional[NgramRetriever] = None,
+    matched_paths: Optional[Dict[object, str]] = None,
+) -> None:
+    # Every title stays in one table while watching (so they're only processed once), the matched titles are marked as used
+    title_table = TitleTable(o_input_df, normalizer=normalizer)
+    title_table.used[:] = o_input_df["Path"].notna().to_numpy()
+    title_ids = pandas.Series(numpy.arange(len(o_input_df)), index=o_input_df.index)
+    # The path of the file matched to each row (only rows this run matched, the paths given in the input file are never changed)
+    matched_paths = dict(matched_paths or {})
+    stages = getStages(user_args.score_engine)
+    # The changed rows are added to the end of the csv, and it's written again once this many rows have been added
+    compact_rows = max(1000, len(o_input_df) // 10)
+    appended = 0
+    signal.signal(signal.SIGTERM, stopProcess)
+    logger.info(f'Watching "{user_args.file_directory}" ({watcher.method()})')
+    try:
+        while True:
+            created, removed, renamed = watcher.waitForChanges()
+            changed = []
+            # Matched entries that were renamed keep their title (the rest are matched like new entries)
+            for old_path, new_path, is_file in renamed:
+                rows = [x for x, y in matched_paths.items() if y == old_path]
+                if len(rows) == 0:
+                    created.append((new_path, is_file))
+                else:
+                    o_input_df.loc[rows, "Path"] = entryName(new_path, is_file)
+                    changed.extend(rows)
+                # The matched entries in a renamed directory are at a new path (their names don't change)
+                prefix = old_path + os.sep
+                for row, path in list(matched_paths.items()):
+                    if path == old_path:
+                        matched_paths[row] = new_path
+                    elif path.startswith(prefix):
+                        matched_paths[row] = new_path + path[len(old_path) :]
+            # Matched entries that were removed free up their titles
+            freed = 0
+            for old_path, is_file in removed:
+                rows = [x for x, y in matched_paths.items() if y == old_path]
+                for row in rows:
+                    del matched_paths[row]
+                blank = [pandas.NA] * len(rows)
+                writeMatches(o_input_df, rows, blank, blank, blank, blank)
+                ids = title_ids[rows].to_numpy()
+                title_table.used[ids] = False
+                title_table.match_file[ids] = -1
+                freed += len(rows)
+                changed.extend(rows)
+            # Only the new entries are scored, unless titles were freed (then every entry that isn't matched is scored)
+            if freed != 0:
+                created = watcher.items()
+            file_df = createFileDataframe(created)
+            file_df = file_df[~file_df["Name"].isin(o_input_df["Path"].dropna())]
+            if len(file_df) != 0 and len(title_table.remaining()) != 0:
+                with timeStep(metrics, "watchMatching"):
+                    file_table = FileTable(file_df, normalizer=normalizer)
+                    used = title_table.used.copy()
+                    matchTables(
+                        file_table,
+                        title_table,
+                        o_input_df,
+                        stages,
+                        user_args.score_limit,
+                        score_pool=score_pool,
+                        metrics=metrics,
+                        assignment=user_args.assignment,
+                        retriever=retriever,
+                    )
+                    new_ids = numpy.flatnonzero(title_table.used & ~used)
+                    matched_paths.update(matchedPaths(title_table, file_table, new_ids))
+                    changed.extend(title_table.ind[new_ids])
+            if metrics is not None:
+                metrics.count("watch_batches", 1)
+                metrics.count("watch_entries_scored", len(file_df))
+            if len(changed) == 0:
+                continue
+            # Updating the output (each title's last row is its current match)
+            rows = list(dict.fromkeys(changed))
+            appended += len(rows)
+            if appended >= compact_rows:
+                writeCsv(user_args.output_csv, o_input_df)
+                appended = 0
+            else:
+                appendCsv(user_args.output_csv, o_input_df.loc[rows])
+            logger.info(
+                f"Scored {len(file_df)} entries ({len(renamed)} renamed and {len(removed)} removed), {len(rows)} titles changed"
+            )
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        watcher.close()
+    # Writing the csv again so every title has one row
+    writeCsv(user_args.output_csv, o_input_df)
+
+
+# Function to run the script from the command line
+def main() -> None:
+    # Creating the logger output
+    createLogger("Title Matcher")
+    # Get the command line (user) arguments
+    user_args = createCliArgs()
+    # Record the metrics of the run (if the user wants them)
+    metrics = None
+    if user_args.metrics_path is not None:
+        metrics = RunMetrics()
+
+    # Run the matching in the profiler (if the user wants to profile it)
+    if user_args.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(runMatching, user_args, metrics)
+        # The stats are saved next to the output (they can be read with pstats or snakeviz)
+        profile_path = user_args.output_csv.with_suffix(".prof")
+        profiler.dump_stats(profile_path)
+        logger.info(f'Wrote the profile at "{profile_path}"')
+    else:
+        runMatching(user_args, metrics)
+
+    # Write the metrics of the run
+    if metrics is not None:
+        metrics.write(user_args.metrics_path)
+
+
+# The logger used by every function (handlers are only added when ran as a script)
+logger = logging.getLogger("Title Matcher")
+
+if __name__ == "__main__":
+    main()
 
 # Footer Comment
 # History of Contributions:
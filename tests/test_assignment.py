@@ -0,0 +1,88 @@
+# Tests for the maximum weight matching used by the optimal assignment (checked against an exhaustive search)
+
+import functools
+import pathlib
+import random
+import sys
+
+import numpy
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import main
+
+
+# Function to find the best total weight by trying every matching (only for small graphs)
+def bruteForceWeight(row_count: int, edges: dict) -> int:
+    columns = sorted({x[1] for x in edges})
+
+    # Function to get the best total weight of the rows from this row on (with the columns that are already used)
+    @functools.lru_cache(maxsize=None)
+    def best(row: int, used: frozenset) -> int:
+        if row == row_count:
+            return 0
+        total = best(row + 1, used)
+        for column in columns:
+            if column not in used and (row, column) in edges:
+                total = max(
+                    total, edges[(row, column)] + best(row + 1, used | {column})
+                )
+        return total
+
+    return best(0, frozenset())
+
+
+# Function to make a random graph (some rows have no edges, and the weights can be limited to a few values for ties)
+def randomGraph(seed: int, weights: list) -> tuple:
+    rng = random.Random(seed)
+    row_count = rng.randint(1, 7)
+    column_count = rng.randint(1, 7)
+    edges = {}
+    for row in range(row_count):
+        # About a quarter of the rows have no edges
+        if rng.random() < 0.25:
+            continue
+        for column in range(column_count):
+            if rng.random() < 0.5:
+                edges[(row, column)] = rng.choice(weights)
+    return (row_count, edges)
+
+
+# Function to check a matching is valid and get its total weight
+def matchingWeight(matched: numpy.ndarray, row_count: int, edges: dict) -> int:
+    assert len(matched) == row_count
+    columns = [int(x) for x in matched if x >= 0]
+    assert len(columns) == len(set(columns))
+    return sum(edges[(row, int(x))] for row, x in enumerate(matched) if x >= 0)
+
+
+@pytest.mark.parametrize(
+    "weights",
+    [list(range(0, 101)), [0, 50, 100], [60, 60, 80, 100], [90]],
+    ids=["any", "few", "ties", "equal"],
+)
+def test_matches_brute_force(weights: list) -> None:
+    for seed in range(300):
+        row_count, edges = randomGraph(seed, weights)
+        rows = numpy.array([x[0] for x in edges], dtype=numpy.intp)
+        columns = numpy.array([x[1] for x in edges], dtype=numpy.intp)
+        scores = numpy.array(list(edges.values()), dtype=numpy.int64)
+        matched = main.maximumWeightMatching(rows, columns, scores, row_count)
+        assert matchingWeight(matched, row_count, edges) == bruteForceWeight(
+            row_count, edges
+        ), f"seed {seed}"
+
+
+def test_no_edges() -> None:
+    empty = numpy.zeros(0, dtype=numpy.intp)
+    matched = main.maximumWeightMatching(
+        empty, empty, numpy.zeros(0, dtype=numpy.int64), 3
+    )
+    assert matched.tolist() == [-1, -1, -1]
+
+
+def test_zero_weight_stays_unmatched() -> None:
+    matched = main.maximumWeightMatching(
+        numpy.array([0, 1]), numpy.array([0, 0]), numpy.array([0, 70]), 2
+    )
+    assert matched.tolist() == [-1, 0]
@@ -0,0 +1,55 @@
+# Tests for the n-gram candidates (with room for every file they have to give the same results as scoring every pair)
+
+import os
+import pathlib
+import sys
+
+import pandas
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import benchmark
+import main
+
+
+# Function to read a generated corpus as titles, given paths, files, and directories
+def readCorpus(directory: pathlib.Path, count: int, seed: int) -> tuple:
+    corpus = benchmark.generateCorpus(directory, count, count, seed)
+    input_df = pandas.read_csv(corpus.input_csv, keep_default_na=False)
+    paths = [x if x != "" else None for x in input_df["Path"]]
+    files, directories = [], []
+    for entry in os.scandir(corpus.file_directory):
+        (files if entry.is_file() else directories).append(entry.name)
+    return (list(input_df["Title"]), paths, sorted(files), sorted(directories))
+
+
+@pytest.mark.parametrize("engine", [-1, 0, 1, 4, 5])
+def test_every_file_as_candidate_is_exact(tmp_path: pathlib.Path, engine: int) -> None:
+    titles, paths, files, directories = readCorpus(tmp_path, 300, engine + 2)
+    exact = main.match(titles, files, 80, engine, directories=directories, paths=paths)
+    candidates = main.match(
+        titles,
+        files,
+        80,
+        engine,
+        directories=directories,
+        paths=paths,
+        retriever=main.NgramRetriever(len(files) + len(directories)),
+    )
+    # Comparing the csv the results would be written as
+    assert candidates.to_csv(index=False) == exact.to_csv(index=False)
+
+
+def test_separators_share_ngrams() -> None:
+    # The n-grams are made from the processed strings, so the separators around a short word don't hide it
+    titles = ["hu", "zu"]
+    files = [
+        "and-hu-day-(2017).mkv",
+        "ka_white_zu_road.mkv",
+        "hush.mkv",
+        "zulu.mkv",
+        "humble pie.mkv",
+        "zut alors.mkv",
+    ]
+    result = main.match(titles, files, 90, 4, retriever=main.NgramRetriever(1))
+    assert list(result["Path"]) == ["and-hu-day-(2017).mkv", "ka_white_zu_road.mkv"]
@@ -0,0 +1,48 @@
+# Tests for the run metrics (every prometheus series has to be written once)
+
+import collections
+import pathlib
+import sys
+
+import pandas
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import benchmark
+import main
+
+
+# Function to get the value of every series in the prometheus text
+def readSeries(text: str) -> dict:
+    series = [x.rsplit(" ", 1) for x in text.splitlines() if not x.startswith("#")]
+    counts = collections.Counter(x[0] for x in series)
+    assert [x for x, y in counts.items() if y > 1] == []
+    return {x: float(y) for x, y in series}
+
+
+def test_repeated_steps_are_added() -> None:
+    metrics = main.RunMetrics()
+    # Like two batches of watch mode
+    for count in [2, 3]:
+        with metrics.timer("findSimilarity", stage=0):
+            pass
+        metrics.count("matches", count, stage=0, iteration=0)
+    series = readSeries(metrics.toPrometheus())
+    assert series['title_matcher_matches{iteration="0",stage="0"}'] == 5
+    assert 'title_matcher_step_wall_seconds{stage="0",step="findSimilarity"}' in series
+
+
+def test_sweep_labels_every_limit(tmp_path: pathlib.Path) -> None:
+    corpus = benchmark.generateCorpus(tmp_path, 200, 200, 1)
+    input_df, file_df = main.createInitialDataframes(
+        corpus.input_csv, corpus.file_directory
+    )
+    metrics = main.RunMetrics()
+    out_path = tmp_path / "matched.csv"
+    main.runSweep(input_df, file_df, [90, 80], -1, out_path, metrics=metrics)
+    series = readSeries(metrics.toPrometheus())
+    # The matches of each limit are kept apart and add up to the summary
+    summary = pandas.read_csv(main.sweepPath(out_path, "summary"), encoding="utf-8-sig")
+    for _, row in summary.iterrows():
+        name = 'title_matcher_matches{{iteration="{}",score_limit="{}",stage="{}"}}'
+        key = name.format(row["Iteration"], row["Score Limit"], row["Engine"])
+        assert series[key] == row["Matches"]
@@ -0,0 +1,87 @@
+# Tests for the small job path (it has to write the same csv as the tables for every engine)
+
+import os
+import pathlib
+import sys
+
+import pandas
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import benchmark
+import main
+
+
+# Function to read a generated corpus as titles, given paths, and entries (duplicate titles, directories, and given paths)
+def readCorpus(directory: pathlib.Path, count: int, seed: int) -> tuple:
+    corpus = benchmark.generateCorpus(directory, count, count, seed)
+    input_df = pandas.read_csv(corpus.input_csv, keep_default_na=False)
+    paths = [x if x != "" else None for x in input_df["Path"]]
+    # The files come before the directories, the same order match() gives them to the tables
+    items = sorted(
+        ((x.name, x.is_file()) for x in os.scandir(corpus.file_directory)),
+        key=lambda x: (not x[1], x[0]),
+    )
+    return (list(input_df["Title"]), paths, items)
+
+
+# Function to get the csv of the small job path and of the tables for the same job
+def bothCsvs(
+    directory: pathlib.Path,
+    titles: list,
+    paths: list,
+    items: list,
+    score_limit: int,
+    engine: int,
+    normalizer: main.Normalizer,
+) -> tuple:
+    small_path = directory / "small.csv"
+    table_path = directory / "table.csv"
+    main.writeSmallCsv(
+        small_path,
+        main.matchSmall(titles, paths, items, score_limit, engine, normalizer),
+    )
+    main.match(
+        titles,
+        [x for x, is_file in items if is_file],
+        score_limit,
+        engine,
+        directories=[x for x, is_file in items if not is_file],
+        paths=paths,
+        normalizer=normalizer,
+    ).to_csv(table_path, index=False, encoding="utf-8-sig")
+    return (small_path.read_bytes(), table_path.read_bytes())
+
+
+@pytest.mark.parametrize("engine", [-1, 0, 1, 2, 3, 4, 5])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_generated_jobs(tmp_path: pathlib.Path, engine: int, seed: int) -> None:
+    titles, paths, items = readCorpus(tmp_path / "corpus", 60, seed)
+    normalizer = main.Normalizer()
+    if seed == 3:
+        normalizer = main.Normalizer(True, True, main.MEDIA_TAGS)
+    for score_limit in [60, 90]:
+        small, table = bothCsvs(
+            tmp_path, titles, paths, items, score_limit, engine, normalizer
+        )
+        assert small == table, f"score limit {score_limit}"
+
+
+@pytest.mark.parametrize("engine", [-1, 0, 1, 2, 3, 4, 5])
+def test_repeated_titles_and_names(tmp_path: pathlib.Path, engine: int) -> None:
+    # Repeated titles, a file and directory with the same stem, tied scores, and a given path
+    titles = ["Movie", "Movie", "The Movie", "Other Film", "Film Other", "Given"]
+    paths = [None, None, None, None, None, "Given.mkv"]
+    items = [
+        ("Movie.mkv", True),
+        ("Movie.srt", True),
+        ("Other Film (2001).mkv", True),
+        ("Film Other.avi", True),
+        ("Given.mkv", True),
+        ("Unrelated.txt", True),
+        ("Movie", False),
+    ]
+    small, table = bothCsvs(
+        tmp_path, titles, paths, items, 70, engine, main.Normalizer()
+    )
+    assert small == table